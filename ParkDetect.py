@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 from datetime import datetime
 import argparse
+import sys
+import os
 
 from modules.processors import YoloProcessor, read_zones_from_file, parse_media_format, MediaFormat
-from modules.processors import StreamProcessor, ImageProcessor
+from modules.processors import StreamProcessor, ImageProcessor, BatchProcessor, OfflineProcessor, SegmentProcessor
+from modules.processors import STREAM_FORMATS
 from modules.protocol import Config, ZoneStatus, PwZoneState, SerialHandler
+from modules.scheduling import SchedulingPlan, set_plan, pin_current_thread, run_self_test
+import cv2
 
 
 def percentage(val):
@@ -14,10 +19,33 @@ def percentage(val):
     return ival
 
 
+def duration(val):
+    units = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    unit = next((u for u in ["ms", "s", "m", "h"] if val.endswith(u)), None)
+    try:
+        seconds = float(val[:-len(unit)] if unit else val) * units.get(unit, 1.0)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{val} is not a valid duration")
+    if seconds <= 0:
+        raise argparse.ArgumentTypeError(f"{val} is not a valid duration")
+    return seconds
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Park Detect',
                                      formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument('-i', '--input', type=str, help='Input file (image/video) or stream (rtsp)', default=None)
+    parser.add_argument('--batch', action="store_true", default=False,
+                        help='Process the images of an input directory or glob, writing JSON lines to the output')
+    parser.add_argument('--batch_size', type=int, help='Number of images per inference batch', default=8)
+    parser.add_argument('--workers', type=int, help='Number of image decoding workers', default=None)
+    parser.add_argument('--offline', action="store_true", default=False,
+                        help='Analyse every frame of an input video as fast as possible, writing the occupancy\n'
+                             'timeline to the output (.csv or JSON lines)')
+    parser.add_argument('--segments', type=int, default=1,
+                        help='Number of worker processes analysing segments of the video in --offline mode')
+    parser.add_argument('--sample_every', type=duration, default=None,
+                        help='In --offline mode, only analyse one frame per interval i.e. "5s", "500ms", "1m"')
     parser.add_argument('-z', '--zones', type=str, required=True, help='Path to the zones config file')
     parser.add_argument('-m', '--model', type=str, help='Model file used for object detection', default="yolov8n.pt")
     parser.add_argument('-c', '--canvas', action="store_true", help='Display the canvas', default=False)
@@ -33,12 +61,83 @@ if __name__ == "__main__":
     parser.add_argument('-d', '--detect_zones', type=str, help='Model file used for zone detection', default="zone.pt")
     parser.add_argument('-l', '--license_plate', type=str, help='Model file used for license plate detection', default="licenseplate.pt")  # noqa
     parser.add_argument('-r', '--auto_record', type=int, help='the duration to wait before auto_record is invoked')
+    parser.add_argument('--decode_process', action="store_true", default=False,
+                        help='Decode video/stream input in a separate process, sharing frames through shared memory')
+    parser.add_argument('--stream_format', type=str, choices=STREAM_FORMATS, default="bgr24",
+                        help='Pixel format piped to ffmpeg for stream output, yuv420p halves the pipe bandwidth')
+    parser.add_argument('--stream_scale', type=float, default=1.0,
+                        help='Scale factor applied to the frames piped to ffmpeg for stream output')
+    parser.add_argument('--clips', type=str, default=None,
+                        help='Directory where clips around every zone occupancy change are saved')
+    parser.add_argument('--clip_pre', type=duration, default=10.0,
+                        help='Duration kept before an occupancy change in its clip i.e. "10s"')
+    parser.add_argument('--clip_post', type=duration, default=5.0,
+                        help='Duration recorded after an occupancy change in its clip i.e. "5s"')
+    parser.add_argument('--preview', type=int, default=None, metavar='PORT',
+                        help='Serve the annotated video as MJPEG (/stream.mjpg) and the zones as JSON (/zones.json)\n'
+                             'over HTTP on this port. Without -c, no window is opened')
+    parser.add_argument('--preview_host', type=str, default="127.0.0.1",
+                        help='Address the preview is served on, i.e. "0.0.0.0" for every interface. The preview\n'
+                             'is not authenticated')
+    parser.add_argument('--preview_fps', type=float, default=5.0, help='Frame rate of the preview')
+    parser.add_argument('--preview_scale', type=float, default=0.5, help='Scale factor of the preview frames')
+    parser.add_argument('--target_fps', type=float, default=None,
+                        help='Frame rate to sustain on video/stream input, degrading graphics, model image size\n'
+                             'and then inference rate while processing falls behind')
+    parser.add_argument('--schedule', type=str, default=None,
+                        help='Thread counts and stage core sets i.e. "torch=4,opencv=1,blas=1,decode=0-1,'
+                             'inference=2-5,render=6,serial=7", or a JSON file with the same keys')
+    parser.add_argument('--schedule_selftest', action="store_true", default=False,
+                        help='Measure the inference frames/second of candidate thread counts on the input and exit.\n'
+                             'Stage core sets are not compared')
+    parser.add_argument('-f', '--plate_format', type=str, choices=["png", "jpg"], default="png",
+                        help='Image format used to save license plates')
 
     args = parser.parse_args()
 
+    # pinning the main thread before loading the models also pins the inference threads they create
+    try:
+        set_plan(SchedulingPlan.parse(args.schedule) if args.schedule else None)
+    except ValueError as e:
+        parser.error(f"--schedule: {e}")
+    pin_current_thread("inference", "render")
+
     begin = datetime.now()
     config = Config(confidence_threshold=args.percentage, tracking=args.track)
+
+    if args.offline and args.segments > 1:
+        if parse_media_format(args.input) != MediaFormat.VIDEO:
+            parser.error("--offline requires a video input")
+        model_args = (args.model, args.size, config.tracking, config.confidence_threshold, args.allow)
+        SegmentProcessor(args.input, model_args, args.zones, args.output, args.segments, args.sample_every).run()
+        sys.exit(0)
+
     model = YoloProcessor(args.model, args.size, config.tracking, config.confidence_threshold, args.allow)
+
+    if args.schedule_selftest:
+        frame = None
+        if parse_media_format(args.input) == MediaFormat.IMAGE:
+            frame = cv2.imread(args.input)
+        else:
+            _, frame = cv2.VideoCapture(args.input).read()
+        if frame is None:
+            parser.error(f"unable to read a frame from {args.input}")
+        best_plan, best_fps = run_self_test(model, frame)[0]
+        print(f"Best configuration: {best_plan} ({best_fps:.2f} frames/s)")
+        sys.exit(0)
+
+    if args.batch:
+        print(f"Model loaded: {(datetime.now() - begin).total_seconds():.3f}")
+        BatchProcessor(args.input, model, args.zones, args.output, args.workers, args.batch_size).run()
+        sys.exit(0)
+
+    if args.offline:
+        if parse_media_format(args.input) != MediaFormat.VIDEO:
+            parser.error("--offline requires a video input")
+        print(f"Model loaded: {(datetime.now() - begin).total_seconds():.3f}")
+        OfflineProcessor(args.input, model, read_zones_from_file(args.zones), args.output, args.sample_every).run()
+        sys.exit(0)
+
     zone_model = YoloProcessor(args.detect_zones, args.size, config.tracking, config.confidence_threshold, args.allow)
     plate_model = YoloProcessor(args.license_plate, args.size, config.tracking, config.confidence_threshold, args.allow)
     print(f"Models loaded: {(datetime.now() - begin).total_seconds():.3f}")
@@ -51,7 +150,10 @@ if __name__ == "__main__":
 
     processor = None
     pygame_module = None
-    enable_canvas = args.canvas or args.output
+    enable_canvas = args.canvas or args.output or args.preview
+    if args.preview and not args.canvas:
+        # the preview is drawn on a canvas that is never shown
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
     if enable_canvas:
         import pygame as pygame
         pygame_module = pygame
@@ -63,10 +165,13 @@ if __name__ == "__main__":
 
     if input_format is MediaFormat.IMAGE:
         processor = ImageProcessor(input_path, model, zone_model, plate_model, zones, zones_cfg,
-                                   enable_canvas, args.output, args.graphics, serial_handler)
+                                   enable_canvas, args.output, args.graphics, serial_handler, args.plate_format)
     elif input_format in [MediaFormat.VIDEO, MediaFormat.STREAM]:
         processor = StreamProcessor(input_path, input_format, model, zone_model, plate_model, zones, zones_cfg,
-                                    enable_canvas, args.output, args.graphics, serial_handler, args.auto_record)
+                                    enable_canvas, args.output, args.graphics, serial_handler, args.auto_record,
+                                    args.plate_format, args.decode_process, args.target_fps,
+                                    args.stream_format, args.stream_scale, args.clips, args.clip_pre, args.clip_post,
+                                    args.preview, args.preview_fps, args.preview_scale, args.preview_host)
 
     try:
         running = True
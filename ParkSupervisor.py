@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+import argparse
+
+from modules.processors import Supervisor, read_site_config
+from modules.protocol import Config, SerialHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Park Detect Supervisor',
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-s', '--site', type=str, required=True,
+                        help='Path to the site config file (JSON) listing the streams and their zones files')
+    parser.add_argument('-b', '--bytebeam', action="store_true", help='Create a ByteBeam endpoint', default=False)
+    parser.add_argument('-m', '--shared_model', action="store_true", default=False,
+                        help='Run all streams in one worker, batching their frames through shared models')
+
+    args = parser.parse_args()
+
+    site = read_site_config(args.site)
+    config = Config(confidence_threshold=site["models"]["percentage"], tracking=site["models"]["track"])
+    supervisor = Supervisor(site, None, args.shared_model)
+
+    serial_handler = None
+    if args.bytebeam:
+        serial_handler = SerialHandler(zones=supervisor.registry.zones, config=config)
+        serial_handler.start_rx_thread()
+        supervisor.serial_handler = serial_handler
+
+    try:
+        supervisor.run()
+
+    except KeyboardInterrupt:
+        print("KeyboardInterrupt")
+
+    finally:
+        if args.bytebeam:
+            serial_handler.stop_rx_thread()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+from pathlib import Path
+import argparse
+import time
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from modules.processors.base_canvas import Canvas  # noqa: E402
+
+
+RESOLUTIONS = [(640, 360), (1280, 720), (1920, 1080), (3840, 2160)]
+
+
+def time_upload(upload, frame, iterations):
+    ''' Time an upload function over a number of iterations
+
+    @param  upload        Function uploading a frame to the canvas
+    @param  frame         The frame uploaded
+    @param  iterations    Number of uploads timed
+
+    @return Average time of an upload in milliseconds '''
+
+    upload(frame)   # warm up
+    begin = time.perf_counter()
+    for _ in range(iterations):
+        upload(frame)
+    return (time.perf_counter() - begin) / iterations * 1000
+
+
+def upload_legacy(canvas: Canvas):
+    # the previous implementation: copy the frame to bytes, wrap it in a new surface and blit it
+    def upload(frame):
+        image = canvas.pygame.image.frombuffer(frame.tobytes(), frame.shape[1::-1], "BGR")
+        canvas.background.blit(image, (0, 0))
+    return upload
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the upload of decoded frames to the canvas')
+    parser.add_argument('-n', '--iterations', type=int, default=100, help='Number of uploads timed per case')
+    args = parser.parse_args()
+
+    # no window is needed to measure the uploads
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+    rng = np.random.default_rng(0)
+    print(f"{'frame':>10} {'canvas':>10} {'legacy ms':>10} {'upload ms':>10}")
+    for width, height in RESOLUTIONS:
+        canvas = Canvas(width, height, "benchmark")
+        for frame_width, frame_height in [(width, height), (width * 3 // 2, height * 3 // 2)]:
+            frame = rng.integers(0, 256, (frame_height, frame_width, 3), dtype=np.uint8)
+            # the legacy path could not scale, it only copied the top left of a larger frame
+            legacy = time_upload(upload_legacy(canvas), frame, args.iterations)
+            upload = time_upload(canvas.upload_frame, frame, args.iterations)
+            print(f"{frame_width:>5}x{frame_height:<4} {width:>5}x{height:<4} {legacy:>10.2f} {upload:>10.2f}")
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+from pathlib import Path
+import argparse
+import time
+import sys
+
+import cv2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from modules.processors import YoloProcessor, OccupancyEngine, read_zones_from_file  # noqa: E402
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the occupancy engine on the frames of a video')
+    parser.add_argument('-i', '--input', type=str, required=True, help='Input video file')
+    parser.add_argument('-z', '--zones', type=str, required=True, help='Path to the zones config file')
+    parser.add_argument('-m', '--model', type=str, default="yolov8n.pt", help='Model file used for object detection')
+    parser.add_argument('-s', '--size', type=int, default=640, help='The image size paramter for the model')
+    parser.add_argument('-a', '--allow', type=str, default=None, help='Comma separated list of detect types to allow')
+    parser.add_argument('-n', '--frames', type=int, default=100, help='Number of frames processed')
+    parser.add_argument('-t', '--trapezoids', action='store_true', help='Fit trapezoids to the segmented areas')
+    args = parser.parse_args()
+
+    cap = cv2.VideoCapture(args.input)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frames = []
+    while len(frames) < args.frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        parser.error(f"unable to read frames from {args.input}")
+
+    model = YoloProcessor(args.model, args.size, False, 25, args.allow)
+    engine = OccupancyEngine(model, read_zones_from_file(args.zones), fit_trapezoids=args.trapezoids)
+    model.predict(frames[0])   # warm up
+
+    # inference and the rest of the engine (trapezoids, zones, events) are timed separately
+    begin = time.perf_counter()
+    detections = [model.predict(frame) for frame in frames]
+    inference = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    events = 0
+    for frame, frame_detections in zip(frames, detections):
+        events += len(engine.process(frame, detections=frame_detections, fps=fps).events)
+    occupancy = time.perf_counter() - begin
+
+    print(f"{len(frames)} frames, {sum(len(d) for d in detections)} detections, {events} events")
+    print(f"inference: {inference / len(frames) * 1000:.2f} ms/frame")
+    print(f"occupancy: {occupancy / len(frames) * 1000:.2f} ms/frame")
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+from pathlib import Path
+import argparse
+import math
+import random
+import time
+import sys
+
+from scipy.spatial import ConvexHull
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from modules.processors.trapezoid import find_best_fit_trapezoid, remove_least_deviation  # noqa: E402
+
+
+def legacy_fit_trapezoid(points):
+    # the scan of every remaining vertex on each removal, as find_best_fit_trapezoid used to do
+    hull = ConvexHull(points)
+    hull_vertices = [points[vertex] for vertex in hull.vertices]
+    while len(hull_vertices) > 4:
+        remove_least_deviation(hull_vertices)
+    return hull_vertices
+
+
+def mask_outline(count, rng):
+    # noisy outline of a vehicle sized blob, with integer points like the segmentation masks
+    cx, cy = rng.uniform(200, 1000), rng.uniform(200, 600)
+    rx, ry = rng.uniform(60, 200), rng.uniform(40, 120)
+    points = []
+    for i in range(count):
+        angle = 2 * math.pi * i / count
+        noise = rng.uniform(0.9, 1.1)
+        points.append([int(cx + rx * noise * math.cos(angle)), int(cy + ry * noise * math.sin(angle))])
+    return points
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the trapezoid fitting on random mask outlines')
+    parser.add_argument('-s', '--sizes', type=str, default="50,200,500,1000", help='Comma separated outline sizes')
+    parser.add_argument('-n', '--masks', type=int, default=200, help='Number of masks of each size')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random outlines')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for size in [int(s) for s in args.sizes.split(",")]:
+        masks = [mask_outline(size, rng) for _ in range(args.masks)]
+
+        begin = time.perf_counter()
+        legacy = [legacy_fit_trapezoid(mask) for mask in masks]
+        legacy_time = time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        current = [find_best_fit_trapezoid(mask) for mask in masks]
+        current_time = time.perf_counter() - begin
+
+        mismatches = sum(a != b for a, b in zip(legacy, current))
+        print(f"{size} points: legacy {legacy_time / len(masks) * 1000:.3f} ms, "
+              f"current {current_time / len(masks) * 1000:.3f} ms, "
+              f"speedup {legacy_time / current_time:.1f}x, {mismatches} mismatches")
@@ -3,3 +3,9 @@ from .zone import read_zones_from_file
 from .base_processor import parse_media_format, MediaFormat
 from .stream_processor import StreamProcessor
 from .image_processor import ImageProcessor
+from .batch_processor import BatchProcessor
+from .offline_processor import OfflineProcessor
+from .segment_processor import SegmentProcessor
+from .supervisor import Supervisor, read_site_config
+from .sinks import STREAM_FORMATS
+from .occupancy_engine import OccupancyEngine, OccupancyResult, OccupancyEvent, EventType
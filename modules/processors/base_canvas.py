@@ -1,15 +1,27 @@
-from shapely.geometry import Polygon
 from cv2.typing import MatLike
 from typing import Tuple, List
+import numpy as np
+import cv2
+import os
 
 from .ymodel import YoloDetection
 from .colors import *
 from .zone import Zone
 
 
+# Rendered text surfaces kept for reuse, the cache is emptied once full
+TEXT_CACHE_SIZE = 512
+
+
 class Canvas():
+    """draws onto the screen in layers: the background frame, the dynamic items drawn on every frame (i.e.
+    detections) and an optional static layer composited on top (i.e. zones). The static layer is only redrawn
+    by its owner when its content changes, and when the background is unchanged only the areas touched by
+    dynamic items are restored and updated on the display """
+
     def __init__(self, width, height, caption, enabled=True, graphics_mask="zod") -> None:
         self.mode_text = None
+        self.status_text = None
         self.width = width
         self.height = height
         self.recording = False
@@ -17,15 +29,32 @@ class Canvas():
         self.dot_pad = 5
         self.graphics_mask = graphics_mask
 
+        self.image_key = None
+        self.image = None
+
+        self.background = None
+        self.background_key = None
+        self.static_layer = None
+        self.full_redraw = True
+        self.dirty_rects = []
+        self.previous_rects = []
+        self.text_cache = {}
+        self.scale_buffer = None
+
         self.pygame = None
         self.enabled = enabled
+        self.headless = False
         if self.enabled:
             import pygame as pygame
             self.pygame = pygame
             self.pygame.init()
 
             self.screen = pygame.display.set_mode((width, height))
+            # holds the decoded frame, in 32 bits like the display so blits to the screen need no conversion
+            self.background = pygame.Surface((width, height), 0, 32)
             pygame.display.set_caption(caption)
+            # with the dummy video driver nothing is shown, the canvas only feeds the outputs
+            self.headless = pygame.display.get_driver() == "dummy"
             self.cap_font = pygame.font.SysFont(None, 40)
             self.sub_font = pygame.font.SysFont(None, 32)
             pygame.display.flip()
@@ -40,21 +69,111 @@ class Canvas():
         if not self.enabled:
             return
 
-        image = self.pygame.image.load(image_path)
-        self.screen.blit(image, (0, 0))
+        # only load the image again when the file changes
+        image_key = (image_path, os.path.getmtime(image_path))
+        if image_key != self.image_key:
+            self.image = self.pygame.image.load(image_path)
+            self.image_key = image_key
+
+        if image_key != self.background_key:
+            self.background.blit(self.image, (0, 0))
+            self.background_key = image_key
+            self.full_redraw = True
 
-    def draw_frame(self, frame: MatLike):
+        self.restore_background()
+
+    def draw_frame(self, frame: MatLike, key=None):
         '''Draw a frame from a stream or video on the canvas
 
         @param  frame      A frame of video to be displayed on the canvas
+        @param  key        Optional identity of the frame (e.g. frame id), the frame is not converted again
+                           while it is unchanged
 
         @return None '''
 
         if not self.enabled:
             return
 
-        image = self.pygame.image.frombuffer(frame.tobytes(), frame.shape[1::-1], "BGR")
-        self.screen.blit(image, (0, 0))
+        if key is None or key != self.background_key:
+            self.upload_frame(frame)
+            self.background_key = key
+            self.full_redraw = True
+
+        self.restore_background()
+
+    def upload_frame(self, frame: MatLike):
+        '''Write a frame into the background surface. The surface wraps the frame buffer without copying it,
+        and the blit converts BGR to the surface format in a single pass. A frame of another size is first
+        scaled (nearest neighbor) by OpenCV into a buffer kept across frames
+
+        @param  frame      A BGR frame of video
+
+        @return None '''
+
+        if frame.shape[:2] != (self.height, self.width):
+            if self.scale_buffer is None or self.scale_buffer.shape[2] != frame.shape[2]:
+                self.scale_buffer = np.empty((self.height, self.width, frame.shape[2]), dtype=frame.dtype)
+            frame = cv2.resize(frame, (self.width, self.height), dst=self.scale_buffer,
+                               interpolation=cv2.INTER_NEAREST)
+
+        # frombuffer() needs the rows packed, which decoded frames already are
+        frame = np.ascontiguousarray(frame)
+        image = self.pygame.image.frombuffer(frame, (self.width, self.height), "BGR")
+        self.background.blit(image, (0, 0))
+
+    def set_enabled(self, enabled: bool):
+        '''Pause or resume drawing on a canvas created enabled, i.e. while nobody watches a headless canvas
+
+        @param  enabled    False to skip all drawing
+
+        @return None '''
+
+        if not self.pygame or enabled == self.enabled:
+            return
+
+        self.enabled = enabled
+        # the screen was not kept up to date while drawing was paused
+        self.full_redraw = True
+        self.dirty_rects = []
+        self.previous_rects = []
+
+    def restore_background(self):
+        '''Start a new frame on the canvas: the whole background is drawn when it changed, otherwise only
+        the areas touched by the previous frame are restored
+
+        @param  None
+
+        @return None '''
+
+        if self.full_redraw:
+            self.screen.blit(self.background, (0, 0))
+        else:
+            for rect in self.previous_rects:
+                self.screen.blit(self.background, rect, rect)
+
+    def set_static_layer(self, layer):
+        '''Set the layer composited over the dynamic items, the whole screen is updated on the next render.
+        Must be called before the dynamic items of the frame are drawn
+
+        @param  layer      A screen sized surface with per-pixel alpha, or None
+
+        @return None '''
+
+        self.static_layer = layer
+        if not self.full_redraw:
+            # the previous layer is still on the screen, wherever the background was not restored
+            self.screen.blit(self.background, (0, 0))
+            self.full_redraw = True
+
+    def mark_dirty(self, rect):
+        '''Record an area of the screen drawn onto for the current frame
+
+        @param  rect       The area drawn onto, as returned by the pygame draw and blit functions
+
+        @return The area drawn onto '''
+
+        self.dirty_rects.append(rect)
+        return rect
 
     def draw_pos(self, pos: Tuple[int, int]):
         '''Write the coordinates of a specific position on the canvas
@@ -86,12 +205,12 @@ class Canvas():
             return
 
         if len(points) > 1:
-            self.pygame.draw.polygon(self.screen, color, points, width=width)
+            self.mark_dirty(self.pygame.draw.polygon(self.screen, color, points, width=width))
         for point in points:
             if point == drag_point:
-                self.pygame.draw.circle(self.screen, MAGENTA, point, point_radius)
+                self.mark_dirty(self.pygame.draw.circle(self.screen, MAGENTA, point, point_radius))
             else:
-                self.pygame.draw.circle(self.screen, color, point, point_radius)
+                self.mark_dirty(self.pygame.draw.circle(self.screen, color, point, point_radius))
 
     def draw_recording_icon(self, enable: bool):
         '''Toggle whether a recording icon should be shown on the canvas
@@ -102,8 +221,18 @@ class Canvas():
 
         self.recording = enable
 
+    def draw_status_text(self, text: str | None):
+        '''Update the status text shown at the top left of the canvas, i.e. a degraded processing quality
+
+        @param  text    The text to display, None to hide it
+
+        @return None '''
+
+        self.status_text = text
+
     def render(self):
-        '''Render the recording icon and/or the mode text on the canvas
+        '''Composite the static layer, render the recording icon, the mode text and the status text on the
+        canvas and update the display, only where it changed
 
         @param  None
 
@@ -112,15 +241,74 @@ class Canvas():
         if not self.enabled:
             return
 
+        # areas restored from the background lost their part of the static layer too
+        if self.static_layer:
+            if self.full_redraw:
+                self.screen.blit(self.static_layer, (0, 0))
+            else:
+                # overlapping areas are merged, blending the layer twice would darken its edges
+                for rect in self.merge_rects(self.dirty_rects + self.previous_rects):
+                    self.screen.blit(self.static_layer, rect, rect)
+
         if self.mode_text:
             self.write_text(self.mode_text, self.cap_font,
                             ((self.dot_size + self.dot_pad) * 2, self.height),
                             YELLOW, self.screen, background=BLACK)
+        if self.status_text:
+            self.write_text(self.status_text, self.cap_font,
+                            (self.dot_pad, self.dot_pad + self.cap_font.get_linesize()),
+                            YELLOW, self.screen, background=BLACK)
         if self.recording:
-            self.pygame.draw.circle(self.screen, RED,
-                                    (self.dot_size + self.dot_pad, self.height - (self.dot_size + self.dot_pad)),
-                                    self.dot_size)
-        self.pygame.display.flip()
+            self.mark_dirty(self.pygame.draw.circle(self.screen, RED,
+                                                    (self.dot_size + self.dot_pad,
+                                                     self.height - (self.dot_size + self.dot_pad)),
+                                                    self.dot_size))
+
+        if self.full_redraw:
+            self.pygame.display.flip()
+        else:
+            self.pygame.display.update(self.dirty_rects + self.previous_rects)
+
+        self.previous_rects = self.dirty_rects
+        self.dirty_rects = []
+        self.full_redraw = False
+
+    def merge_rects(self, rects):
+        '''Merge overlapping rectangles until none of them overlap
+
+        @param  rects    List of rectangles
+
+        @return List of non-overlapping rectangles covering the same areas '''
+
+        merged = []
+        for rect in rects:
+            rect = self.pygame.Rect(rect)
+            index = rect.collidelist(merged)
+            while index != -1:
+                rect.union_ip(merged.pop(index))
+                index = rect.collidelist(merged)
+            merged.append(rect)
+        return merged
+
+    def export_frame(self):
+        '''Export the annotated canvas as a BGR frame, the layout expected by OpenCV and the outputs. The
+        screen pixels are viewed in that layout and copied once into a new frame, which the outputs share
+        and write in the background
+
+        @param  None
+
+        @return The annotated frame, or None if the canvas is disabled '''
+
+        if not self.enabled:
+            return None
+
+        frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        view = self.pygame.surfarray.pixels3d(self.screen).swapaxes(0, 1)[:, :, ::-1]
+        np.copyto(frame, view)
+
+        # the surface stays locked while a view of its pixels exists
+        del view
+        return frame
 
     def save_image(self, output_path: str):
         '''Save the image data on the canvas to the provided path
@@ -143,15 +331,6 @@ class Canvas():
 
         return self.pygame.Rect(int(box[0]), int(box[1]), int(box[2] - box[0]), int(box[3] - box[1]))
 
-    def get_polygon_points(self, mask: List[List[int]]):
-        '''Create a list of points defined by the mask
-
-        @param  box    List of points in xy format
-
-        @return List of points '''
-
-        return [[int(p[0]), int(p[1])] for p in mask]
-
     def get_box_caption(self, box: List[int]):
         '''Get the coordinates where a caption for a box object should be displayed
 
@@ -161,15 +340,6 @@ class Canvas():
 
         return (int(box[0]), int(box[1]))
 
-    def get_polygon_coords(self, poly: Polygon):
-        '''Get the coordinates of a polygon object
-
-        @param  poly    The polygon whose coordinates are being requested
-
-        @return Coordinates of the provided polygon object '''
-
-        return [(int(x), int(y)) for x, y in poly.exterior.coords]
-
     def write_text(self, text, font, top_left, color, screen, background=None):
         '''Write some text onto the canvas
 
@@ -185,12 +355,20 @@ class Canvas():
         if not self.enabled:
             return
 
-        # Render the text
-        text_surface = font.render(text, True, color, background)
+        # Render the text, labels repeat from frame to frame
+        text_key = (text, id(font), color, background)
+        text_surface = self.text_cache.get(text_key)
+        if text_surface is None:
+            if len(self.text_cache) >= TEXT_CACHE_SIZE:
+                self.text_cache.clear()
+            text_surface = font.render(text, True, color, background)
+            self.text_cache[text_key] = text_surface
 
         # Calculate the position for the text
         text_rect: self.pygame.Rect = text_surface.get_rect()
         text_rect.bottomleft = top_left
 
         # Blit the text onto the screen
-        screen.blit(text_surface, text_rect)
+        rect = screen.blit(text_surface, text_rect)
+        if screen is self.screen:
+            self.mark_dirty(rect)
@@ -1,5 +1,4 @@
 from abc import ABC, abstractmethod
-import time
 import cv2
 
 from .zone import Zone
@@ -8,11 +7,12 @@ from .mediaformat import *
 from .colors import *
 from .parkcounter import ParkCounter
 from .ymodel import YoloDetection, YoloProcessor
-from .trapezoid import find_best_fit_trapezoid
+from .platecache import PlateCache
+from .occupancy_engine import OccupancyEngine, OccupancyResult, EventType
+from .image_writer import ImageWriter
 from ..protocol import SerialHandler, PwCommandCodes, PwZoneState
 from datetime import datetime
 from typing import List
-from shapely import Point, Polygon
 
 
 PERCENTAGE_ADJUSTMENT = 5
@@ -21,7 +21,12 @@ DRAG_ENABLE_RADIUS = 6
 
 class Processor(ABC):
     def __init__(self, obj_model: YoloProcessor, zone_model: YoloProcessor, plate_model: YoloProcessor,
-                 zones: List[Zone], zones_cfg, enable_canvas, output_path, serial_handler: SerialHandler | None):
+                 zones: List[Zone], zones_cfg, enable_canvas, output_path, serial_handler: SerialHandler | None,
+                 plate_format="png"):
+        self.plate_cache = PlateCache()
+        # the trapezoids are drawn on the canvas and used to create zones by clicking them
+        self.engine = OccupancyEngine(obj_model, zones, plate_model, self.plate_cache, fit_trapezoids=True)
+        self.engine.add_observer(self.handle_result)
         self.zones = zones
         self.zone_setting: Zone = None
         self.enable_canvas = enable_canvas
@@ -33,10 +38,12 @@ class Processor(ABC):
         self.pygame = None
         self.class_recorder = None
         self.counter = ParkCounter()
+        self.plate_format = plate_format
+        self.image_writer = ImageWriter()
+        self.clip_recorder = None
         self.serial_handler = serial_handler
         self.drag_point = None
         self.drag_enabled = False
-        self.trapezoids: List[List[List[int, int]]] = []
         self.pending_zone_points = []
 
         self.model = obj_model
@@ -56,17 +63,37 @@ class Processor(ABC):
             import pygame as pygame
             self.pygame = pygame
 
+    @property
+    def model(self) -> YoloProcessor:
+        return self.engine.model
+
+    @model.setter
+    def model(self, model: YoloProcessor):
+        self.engine.model = model
+
+    @property
+    def zones(self) -> List[Zone]:
+        return self.engine.zones
+
+    @zones.setter
+    def zones(self, zones: List[Zone]):
+        self.engine.zones = zones
+
+    @property
+    def trapezoids(self) -> List[List[List[int]]]:
+        return self.engine.trapezoids
+
     def handle_occupancy_change(self, zone):
         ''' Handle sending out occupancy change events
 
         @param  zone    zone that encurred the change
 
         @return None '''
+        if self.clip_recorder and zone.status != PwZoneState.Unavailable:
+            self.clip_recorder.trigger(f"zone{zone.zoneId}_{zone.status.name}")
+
         if self.serial_handler:
             self.serial_handler.send_command(PwCommandCodes.ZoneStatus, [zone])
-            # HACK: transmission should be handled on a seperate thread of execution to avoid
-            # this delay leaking out
-            time.sleep(0.1)
         else:
             print(f"Zone {zone.zoneId}: {zone.status.name}")
 
@@ -80,68 +107,47 @@ class Processor(ABC):
         else:
             self.canvas.draw_mode_text(f"Zone[{self.zone_setting.zoneId}: {point_cnt} points.]")
 
-    def merge_overlapping_polygons(self, polygons):
-        num_polygons = len(polygons)
-        merged_polygons = []
-        while polygons:
-            current_polygon = polygons.pop(0)
-            overlaps = [i for i, poly in enumerate(polygons) if current_polygon.intersects(poly)]
-            for overlap_index in overlaps[::-1]:
-                union_polygon = current_polygon.union(polygons.pop(overlap_index))
-                # Without this check, we sometimes get an unexpected MultiPolygon result of the union
-                # How can this happen if they overlap? It's a mystery wrapped in an enigma.
-                if union_polygon.geom_type == 'Polygon':
-                    current_polygon = union_polygon
-            merged_polygons.append(current_polygon)
-
-        # Recursively merge overlapping polygons
-        if len(merged_polygons) < num_polygons:
-            return self.merge_overlapping_polygons(merged_polygons)
-
-        return merged_polygons
-
-    def draw_detections(self, source):
-        detections: List[YoloDetection] = self.model.predict(source)
-
-        self.trapezoids = []
-        for detection in detections:
+    def draw_detections(self, source, frame_key=None, detections: List[YoloDetection] | None = None):
+        ''' Process the source through the occupancy engine, whose observers handle the zone events and
+        draw the results on the canvas
+
+        @param  source        The source image path or video/stream frame
+        @param  frame_key     Optional identity of the source (e.g. path and mtime, or frame id). Detection
+                              results are reused while it is unchanged
+        @param  detections    Optional detections for the source, when inference is done by the caller
+
+        @return The detections used for the source '''
+
+        return self.engine.process(source, frame_key, detections, self.fps).detections
+
+    def handle_result(self, result: OccupancyResult):
+        ''' Handle the events of a processed frame: count the vehicles, send out the occupancy changes and
+        save the license plates found
+
+        @param  result    The result of the frame from the occupancy engine
+
+        @return None '''
+
+        for detection in result.detections:
             if detection.mask is None:
                 self.counter.add_vehicle(vehicle_id=detection.id)
-                self.canvas.draw_detection(detection)
-            else:
-                trapezoid_points = None
-                polygon_points = self.canvas.get_polygon_points(detection.mask)
-                if len(polygon_points) >= 2:
-                    trapezoid_points = find_best_fit_trapezoid(polygon_points)
-                if trapezoid_points:
-                    self.trapezoids.append(trapezoid_points)
-
-        trapezoid_polygons = [Polygon(trapezoid) for trapezoid in self.trapezoids]
-        merged_polygons = self.merge_overlapping_polygons(trapezoid_polygons)
-        self.trapezoids = []
-        for trap_poly in merged_polygons:
-            trap_points = self.canvas.get_polygon_coords(trap_poly)
-            trap_points = find_best_fit_trapezoid(trap_points)
-            self.trapezoids.append(trap_points)
-            self.canvas.draw_points(trap_points, color=BLUE, width=0)
-            self.canvas.draw_points(trap_points, color=RED, width=2)
-
-        for zone in self.zones:
-            if zone.status == PwZoneState.Occupied and zone.license_plate == False:
-                license_plates: List[YoloDetection] = self.plate_model.predict(source)
-                for license_plate in license_plates:
-                    self.save_cropped_image(zone, self.canvas.get_box_rect(license_plate.box))
-                    zone.license_plate = True
-
-            changed, parked_id = zone.update_occupancy(detections, self.fps)
-            if parked_id:
-                self.counter.add_vehicle(vehicle_id=parked_id, zone_id=zone.zoneId)
-            if changed:
-                self.handle_occupancy_change(zone)
-
-            self.canvas.draw_zone(zone)
-
-    def save_cropped_image(self, zone: Zone, rect):
+
+        for event in result.events:
+            if event.type == EventType.VEHICLE_PARKED:
+                self.counter.add_vehicle(vehicle_id=event.vehicle_id, zone_id=event.zone.zoneId)
+            elif event.type == EventType.ZONE_CHANGED:
+                self.handle_occupancy_change(event.zone)
+            elif event.type == EventType.LICENSE_PLATE and event.plate is not None:
+                self.save_cropped_image(event.zone, event.plate)
+
+    def save_cropped_image(self, zone: Zone, cropped_image):
+        ''' Save the image of a license plate. Encoding and writing the image happens in the background
+
+        @param  zone             zone where the license plate was found
+        @param  cropped_image    Image of the license plate, taken from the decoded frame
+
+        @return None '''
+
         # Get current timestamp
         current_time = datetime.now()
 
@@ -149,13 +155,11 @@ class Processor(ABC):
         timestamp_str = current_time.strftime("%Y%m%d_%H%M%S")
 
         # Format the filename
-        screenshot_name = f"{zone.zoneId}_{timestamp_str}.png"
+        screenshot_name = f"{zone.zoneId}_{timestamp_str}.{self.plate_format}"
 
-        # Extract the specified area as a subsurface
-        cropped_surface = self.canvas.screen.subsurface(rect)
-
-        # Save the subsurface as an image
-        self.pygame.image.save(cropped_surface, screenshot_name)
+        # Queue the image to be saved
+        if cropped_image.size and not self.image_writer.save(screenshot_name, cropped_image):
+            print(f"Dropped license plate image {screenshot_name}")
 
     @abstractmethod
     def render(self):
@@ -169,4 +173,5 @@ class Processor(ABC):
 
     @abstractmethod
     def finalize(self):
-        pass
+        self.image_writer.stop()
+        print(f"License plate images: {self.image_writer.stats()}")
@@ -0,0 +1,169 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from typing import List, Dict
+import glob
+import json
+import os
+import sys
+import time
+import cv2
+
+from .mediaformat import MediaFormat, parse_media_format
+from .ymodel import YoloProcessor
+from .zone import read_zones_from_file
+from .occupancy_engine import OccupancyEngine
+
+
+BATCH_SIZE = 8
+ZONES_FILE_NAME = "zones.cfg"
+
+
+def find_images(input_pattern: str) -> List[str]:
+    ''' Find the images to be processed in batch mode
+
+    @param  input_pattern    A directory (searched recursively) or a glob pattern
+
+    @return Sorted list of image paths '''
+
+    if os.path.isdir(input_pattern):
+        input_pattern = os.path.join(input_pattern, "**", "*")
+
+    images = []
+    for path in glob.glob(input_pattern, recursive=True):
+        try:
+            if os.path.isfile(path) and parse_media_format(path) == MediaFormat.IMAGE:
+                images.append(path)
+        except ValueError:
+            pass
+
+    return sorted(images)
+
+
+class BatchProcessor():
+    """evaluates zone occupancy over many images without a canvas, writing one JSON record per image """
+
+    def __init__(self, input_pattern: str, model: YoloProcessor, zones_cfg: str, output_path: str | None,
+                 workers: int | None = None, batch_size: int = BATCH_SIZE) -> None:
+        self.input_pattern = input_pattern
+        self.model = model
+        self.zones_cfg = zones_cfg
+        self.output_path = output_path
+        self.workers = workers or os.cpu_count()
+        self.batch_size = batch_size
+        self.engines: Dict[str, OccupancyEngine] = {}
+
+    def get_engine(self, image_path: str) -> OccupancyEngine:
+        ''' Get the occupancy engine of the camera an image belongs to, holding the zones of the camera. A
+        zones file next to the image takes precedence over the default zones file
+
+        @param  image_path    Path of the image being processed
+
+        @return Occupancy engine for the image '''
+
+        zones_cfg = os.path.join(os.path.dirname(image_path), ZONES_FILE_NAME)
+        if not os.path.isfile(zones_cfg):
+            zones_cfg = self.zones_cfg
+
+        if zones_cfg not in self.engines:
+            zones = [zone for zone in read_zones_from_file(zones_cfg) if zone.is_valid()]
+            self.engines[zones_cfg] = OccupancyEngine(self.model, zones)
+        return self.engines[zones_cfg]
+
+    def decode_image(self, image_path: str):
+        ''' Decode an image, this runs on the worker pool
+
+        @param  image_path    Path of the image to be decoded
+
+        @return A (path, image, seconds) tuple, image is None if it could not be decoded '''
+
+        begin = time.perf_counter()
+        image = cv2.imread(image_path)
+        return (image_path, image, time.perf_counter() - begin)
+
+    def evaluate_zones(self, image_path: str, detections) -> List[Dict]:
+        ''' Evaluate the occupancy of the zones of an image
+
+        @param  image_path    Path of the image being processed
+        @param  detections    List of objects detected in the image
+
+        @return List of zone records '''
+
+        # without inertia (fps of 0) the zone states follow the current image
+        result = self.get_engine(image_path).process(image_path, detections=detections, fps=0)
+        records = []
+        for zone in result.zones:
+            coverage = zone.overlap.area / zone.polygon.area if zone.overlap else 0.0
+            records.append({"zone": zone.zoneId, "status": zone.status.name, "coverage": round(coverage, 3),
+                            "vehicle": zone.overlap_id})
+        return records
+
+    def run(self):
+        ''' Process all the images, decoding them on a worker pool and detecting objects in batches
+
+        @param  None
+
+        @return None '''
+
+        images = find_images(self.input_pattern)
+        print(f"Batch processing {len(images)} images with {self.workers} workers", file=sys.stderr)
+
+        output = open(self.output_path, "w") if self.output_path else sys.stdout
+        begin = time.perf_counter()
+        processed = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                batch = []
+                for decoded in self.__decode_images(pool, images):
+                    batch.append(decoded)
+                    if len(batch) == self.batch_size:
+                        processed += self.__process_batch(batch, output)
+                        batch = []
+                if batch:
+                    processed += self.__process_batch(batch, output)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        total_seconds = time.perf_counter() - begin
+        rate = processed / total_seconds if total_seconds else 0.0
+        print(f"Processed {processed} images in {total_seconds:.3f}s ({rate:.2f} images/s)", file=sys.stderr)
+
+    def __decode_images(self, pool: ThreadPoolExecutor, images: List[str]):
+        # Keep a bounded number of images decoding ahead, so memory does not grow with the input size
+        pending = deque()
+        for image_path in images:
+            pending.append(pool.submit(self.decode_image, image_path))
+            if len(pending) >= self.batch_size * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def __process_batch(self, batch, output) -> int:
+        valid = [(path, image, decode) for path, image, decode in batch if image is not None]
+        for path, image, decode in batch:
+            if image is None:
+                output.write(json.dumps({"image": path, "error": "unable to decode image"}) + "\n")
+
+        if not valid:
+            return 0
+
+        begin = time.perf_counter()
+        results = self.model.predict_batch([image for _, image, _ in valid])
+        inference = (time.perf_counter() - begin) / len(valid)
+
+        for (path, image, decode), detections in zip(valid, results):
+            begin = time.perf_counter()
+            zones = self.evaluate_zones(path, detections)
+            record = {
+                "image": path,
+                "detections": len(detections),
+                "zones": zones,
+                "timings": {
+                    "decode": round(decode, 4),
+                    "inference": round(inference, 4),
+                    "zones": round(time.perf_counter() - begin, 4),
+                },
+            }
+            output.write(json.dumps(record) + "\n")
+
+        return len(valid)
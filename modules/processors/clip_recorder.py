@@ -0,0 +1,163 @@
+from collections import deque
+from datetime import datetime
+import threading
+import time
+import os
+import cv2
+
+from .sinks import FrameSink
+
+
+CLIP_PRE_SECONDS = 10.0
+CLIP_POST_SECONDS = 5.0
+# Frames are kept at most at this rate, JPEG compressed, and the ring never holds more than CLIP_BUFFER_BYTES
+CLIP_FPS = 10.0
+CLIP_JPEG_QUALITY = 75
+CLIP_BUFFER_BYTES = 64 * 1024 * 1024
+# Back to back events keep extending a clip, it is saved and a new one started once it reaches either limit
+CLIP_MAX_SECONDS = 120.0
+CLIP_MAX_BYTES = CLIP_BUFFER_BYTES
+CLIP_QUEUE_SIZE = 16
+
+
+class Clip():
+    """frames of a clip being recorded, and the events it covers """
+
+    def __init__(self, frames, end_time: float, events=None) -> None:
+        self.frames = frames
+        self.end_time = end_time
+        self.events = events if events is not None else []
+        self.bytes = sum(jpeg.nbytes for _, jpeg in frames)
+
+
+class ClipRecorder(FrameSink):
+    """keeps the last seconds of frames in a ring of JPEG images, and saves a clip around each event, from
+    pre_seconds before it to post_seconds after it. Frames are compressed on the writer thread of the sink,
+    clips are encoded to video files in the background. Events overlapping a clip being recorded extend it,
+    and a clip never repeats the frames of the previous one. A clip extended past max_clip_seconds or
+    max_clip_bytes is saved, and recording goes on in a new clip """
+
+    def __init__(self, output_dir: str, pre_seconds=CLIP_PRE_SECONDS, post_seconds=CLIP_POST_SECONDS,
+                 fps=CLIP_FPS, max_bytes=CLIP_BUFFER_BYTES, max_clip_seconds=CLIP_MAX_SECONDS,
+                 max_clip_bytes=CLIP_MAX_BYTES) -> None:
+        self.output_dir = output_dir
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.frame_interval = 1.0 / fps
+        self.max_bytes = max_bytes
+        self.max_clip_seconds = max_clip_seconds
+        self.max_clip_bytes = max_clip_bytes
+        os.makedirs(output_dir, exist_ok=True)
+
+        # (timestamp, jpeg) of the last pre_seconds, only used on the writer thread
+        self.ring = deque()
+        self.ring_bytes = 0
+        self.clip: Clip | None = None
+        self.last_clip_time = 0.0
+        self.last_frame_time = 0.0
+        self.events = []
+        self.clip_threads = []
+        self.clips = 0
+        super().__init__("clip recorder", CLIP_QUEUE_SIZE)
+
+    def add_frame(self, frame):
+        ''' Add a frame to the ring, frames arriving faster than the clip frame rate are skipped
+
+        @param frame    BGR frame, copied as the caller may reuse its buffer
+
+        @return None '''
+
+        now = time.monotonic()
+        if now - self.last_frame_time < self.frame_interval:
+            return
+
+        self.last_frame_time = now
+        self.submit((now, frame.copy()))
+
+    def trigger(self, label: str):
+        ''' Save a clip around the current time
+
+        @param label    Name of the event, included in the clip file name
+
+        @return None '''
+
+        with self.condition:
+            self.events.append((time.monotonic(), label))
+
+    def stats(self):
+        stats = super().stats()
+        stats["clips"] = self.clips
+        return stats
+
+    def write(self, item):
+        timestamp, frame = item
+        ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, CLIP_JPEG_QUALITY])
+        if not ok:
+            raise RuntimeError("JPEG encoding failed")
+
+        with self.condition:
+            events, self.events = self.events, []
+        for event_time, label in events:
+            if self.clip is None:
+                # the frames already saved in the previous clip are not repeated
+                self.clip = Clip([entry for entry in self.ring if entry[0] > self.last_clip_time], 0.0)
+            self.clip.end_time = max(self.clip.end_time, event_time + self.post_seconds)
+            self.clip.events.append(label)
+
+        entry = (timestamp, jpeg)
+        self.ring.append(entry)
+        self.ring_bytes += jpeg.nbytes
+        while self.ring and (self.ring[0][0] < timestamp - self.pre_seconds or self.ring_bytes > self.max_bytes):
+            self.ring_bytes -= self.ring.popleft()[1].nbytes
+
+        if self.clip:
+            # the clip shares the compressed frames with the ring
+            self.clip.frames.append(entry)
+            self.clip.bytes += jpeg.nbytes
+            if timestamp >= self.clip.end_time:
+                self.save_clip(self.clip)
+                self.last_clip_time = timestamp
+                self.clip = None
+            elif timestamp - self.clip.frames[0][0] >= self.max_clip_seconds or \
+                    self.clip.bytes >= self.max_clip_bytes:
+                # the next clip goes on until the end of the events so far, under the name of the latest
+                self.save_clip(self.clip)
+                self.last_clip_time = timestamp
+                self.clip = Clip([], self.clip.end_time, self.clip.events[-1:])
+
+    def save_clip(self, clip: Clip):
+        ''' Encode a clip to a video file in the background
+
+        @param clip    The clip to save
+
+        @return None '''
+
+        # named after the first event, with the number of events when there are more
+        label = clip.events[0] if len(clip.events) == 1 else f"{clip.events[0]}_x{len(clip.events)}"
+        name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{label}.mp4"
+        thread = threading.Thread(target=self._write_clip, args=(os.path.join(self.output_dir, name), clip.frames),
+                                  daemon=True)
+        thread.start()
+        self.clip_threads = [t for t in self.clip_threads if t.is_alive()] + [thread]
+        self.clips += 1
+
+    def close_output(self):
+        # a clip still waiting for its end is saved with the frames received so far
+        if self.clip and self.clip.frames:
+            self.save_clip(self.clip)
+            self.clip = None
+        for thread in self.clip_threads:
+            thread.join()
+
+    def _write_clip(self, path, frames):
+        duration = frames[-1][0] - frames[0][0]
+        fps = (len(frames) - 1) / duration if duration > 0 else 1.0 / self.frame_interval
+        video = None
+        for _, jpeg in frames:
+            frame = cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+            if video is None:
+                video = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, frame.shape[1::-1])
+            video.write(frame)
+        if video is not None:
+            video.release()
+            print(f"Saved clip {path} ({len(frames)} frames)")
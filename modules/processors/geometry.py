@@ -0,0 +1,22 @@
+from shapely.geometry import Polygon
+from typing import List
+
+
+def get_polygon_points(mask: List[List[float]]) -> List[List[int]]:
+    ''' Create a list of integer points from the outline of a segmentation mask
+
+    @param  mask    List of points in xy format
+
+    @return List of points '''
+
+    return [[int(p[0]), int(p[1])] for p in mask]
+
+
+def get_polygon_coords(poly: Polygon) -> List[tuple]:
+    ''' Get the integer coordinates of the exterior of a polygon
+
+    @param  poly    The polygon whose coordinates are being requested
+
+    @return Coordinates of the provided polygon object '''
+
+    return [(int(x), int(y)) for x, y in poly.exterior.coords]
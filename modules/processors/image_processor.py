@@ -1,4 +1,5 @@
 from typing import List
+import os
 
 from .input_processor import *
 from .ymodel import YoloProcessor
@@ -7,10 +8,11 @@ from .zone import Zone
 
 class ImageProcessor(InputProcessor):
     def __init__(self, input_path, model: YoloProcessor, zone_model: YoloProcessor, plate_model: YoloProcessor,
-                 zones: List[Zone], zones_cfg, enable_canvas, output_path, graphics_mask, serial_handler) -> None:
+                 zones: List[Zone], zones_cfg, enable_canvas, output_path, graphics_mask, serial_handler,
+                 plate_format="png") -> None:
         super().__init__(zones=zones, obj_model=model, zone_model=zone_model, plate_model=plate_model,
                          zones_cfg=zones_cfg, enable_canvas=enable_canvas, output_path=output_path,
-                         serial_handler=serial_handler)
+                         serial_handler=serial_handler, plate_format=plate_format)
 
         self.zones = zones
         self.input_path = input_path
@@ -20,7 +22,11 @@ class ImageProcessor(InputProcessor):
                                       "Park Detect",
                                       enable_canvas,
                                       graphics_mask)
+        if enable_canvas:
+            self.engine.add_observer(self.canvas.draw_result)
         self.output_path = output_path
+        self.frame = None
+        self.frame_key = None
 
         if enable_canvas:
             self.stream_handlers = {
@@ -49,15 +55,21 @@ class ImageProcessor(InputProcessor):
 
         @return None '''
 
+        # The image is only decoded again, and detections only re-run, when the file changes
+        frame_key = (self.input_path, os.path.getmtime(self.input_path))
+        if frame_key != self.frame_key:
+            self.frame = cv2.imread(self.input_path)
+            self.frame_key = frame_key
+
         self.canvas.draw_image(self.input_path)
 
-        self.draw_detections(self.input_path)
+        self.draw_detections(self.frame if self.frame is not None else self.input_path, frame_key=frame_key)
 
         super().render()
         self.canvas.render()
 
     def finalize(self):
-        pass
+        super().finalize()
 
     def handle_k_r(self, event):
         if self.output_format == MediaFormat.IMAGE:
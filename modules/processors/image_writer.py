@@ -0,0 +1,71 @@
+import cv2
+import queue
+import threading
+
+
+IMAGE_WRITER_THREADS = 2
+IMAGE_WRITER_QUEUE_SIZE = 32
+
+
+class ImageWriter:
+    """encodes and saves images in background threads, dropping images when the queue is full """
+
+    def __init__(self, threads=IMAGE_WRITER_THREADS, queue_size=IMAGE_WRITER_QUEUE_SIZE):
+        self.q = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._writer, daemon=True) for _ in range(threads)]
+        for thread in self.threads:
+            thread.start()
+
+    def save(self, path: str, image) -> bool:
+        ''' Queue an image to be encoded and written to disk, without waiting for it
+
+        @param path     Path of the image file, the extension selects the encoding (e.g. png, jpg)
+        @param image    Image data in BGR format, must not be modified by the caller afterwards
+
+        @return True if the image was queued, False if it was dropped because the queue is full '''
+
+        try:
+            self.q.put_nowait((path, image))
+            return True
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            return False
+
+    def stop(self):
+        ''' Write the images still queued and stop the writer threads
+
+        @param None
+
+        @return None '''
+
+        for _ in self.threads:
+            self.q.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def stats(self):
+        ''' Get the number of images written and dropped
+
+        @param None
+
+        @return Dictionary with the written and dropped counts '''
+
+        with self.lock:
+            return {"written": self.written, "dropped": self.dropped}
+
+    def _writer(self):
+        while True:
+            item = self.q.get()
+            if item is None:
+                break
+
+            path, image = item
+            if cv2.imwrite(path, image):
+                with self.lock:
+                    self.written += 1
+            else:
+                print(f"Error: failed to write {path}")
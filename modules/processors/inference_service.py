@@ -0,0 +1,97 @@
+from typing import Callable
+import threading
+import time
+
+from .ymodel import YoloProcessor
+
+
+INFERENCE_MAX_WAIT = 0.05
+INFERENCE_POLL_SECONDS = 0.005
+# Without any new frame, batches are still run (empty) this often so the streams can check their health
+INFERENCE_IDLE_SECONDS = 0.5
+
+
+class InferenceService():
+    """runs the latest frames of several streams through one shared model as a single batch, and hands
+    the detections back to each stream """
+
+    def __init__(self, model: YoloProcessor, max_wait=INFERENCE_MAX_WAIT) -> None:
+        self.model = model
+        self.max_wait = max_wait
+        self.streams = []
+        self.frame_ready = threading.Event()
+        self.batches = 0
+        self.frames = 0
+
+    def add_stream(self, capture, callback: Callable):
+        ''' Register a stream with the service
+
+        @param  capture     The capture the frames of the stream are read from
+        @param  callback    Called as callback(frame, detections) for every batch. frame and detections
+                            are None when the stream had no new frame in time for the batch
+
+        @return None '''
+
+        listeners = getattr(capture, "listeners", None)
+        if listeners is not None:
+            listeners.append(self.frame_ready)
+        self.streams.append((capture, callback))
+
+    def collect(self):
+        ''' Collect a new frame from every stream, waiting at most max_wait for the slower streams once the
+        first frame is available
+
+        @param  None
+
+        @return List with the new frame of each stream, None for streams without a new frame '''
+
+        frames = [None] * len(self.streams)
+        idle_deadline = time.monotonic() + INFERENCE_IDLE_SECONDS
+        deadline = None
+        while True:
+            self.frame_ready.clear()
+            for index, (capture, _) in enumerate(self.streams):
+                if frames[index] is None:
+                    frames[index] = capture.read(timeout=0)
+
+            received = sum(frame is not None for frame in frames)
+            if received == len(self.streams):
+                return frames
+
+            now = time.monotonic()
+            if received and deadline is None:
+                deadline = now + self.max_wait
+            if (deadline is not None and now >= deadline) or (deadline is None and now >= idle_deadline):
+                return frames
+
+            # captures without listeners (i.e. decoding in another process) are polled
+            timeout = INFERENCE_POLL_SECONDS if deadline is None else min(deadline - now, INFERENCE_POLL_SECONDS)
+            self.frame_ready.wait(timeout)
+
+    def run_once(self):
+        ''' Run one batch: collect the frames, detect objects in all of them at once, and hand the
+        detections to each stream
+
+        @param  None
+
+        @return Number of frames processed in the batch '''
+
+        frames = self.collect()
+        batch = [frame for frame in frames if frame is not None]
+        results = iter(self.model.predict_batch(batch))
+        for frame, (_, callback) in zip(frames, self.streams):
+            callback(frame, next(results) if frame is not None else None)
+
+        self.batches += 1
+        self.frames += len(batch)
+        return len(batch)
+
+    def stats(self):
+        ''' Get the number of batches and frames processed, and the average batch size
+
+        @param  None
+
+        @return Dictionary with the batch and frame counts '''
+
+        return {"batches": self.batches, "frames": self.frames,
+                "batch_size": round(self.frames / self.batches, 2) if self.batches else 0.0}
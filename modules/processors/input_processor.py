@@ -14,10 +14,11 @@ DRAG_ENABLE_RADIUS = 6
 
 class InputProcessor(Processor):
     def __init__(self, obj_model: YoloProcessor, zone_model: YoloProcessor, plate_model: YoloProcessor,
-                 zones: List[Zone], zones_cfg, enable_canvas, output_path, serial_handler: SerialHandler | None):
+                 zones: List[Zone], zones_cfg, enable_canvas, output_path, serial_handler: SerialHandler | None,
+                 plate_format="png"):
         super().__init__(zones=zones, obj_model=obj_model, zone_model=zone_model, plate_model=plate_model,
                          zones_cfg=zones_cfg, enable_canvas=enable_canvas, output_path=output_path,
-                         serial_handler=serial_handler)
+                         serial_handler=serial_handler, plate_format=plate_format)
 
         if enable_canvas:
             self.event_handlers = {
@@ -144,6 +145,7 @@ class InputProcessor(Processor):
             print(f"Total Count: {self.counter.get_count()}")
             for zone in self.zones:
                 print(f"Zone {zone.zoneId}: {self.counter.get_count(zone_id=zone.zoneId)} vehicles parked")
+            print(f"License plate cache: {self.plate_cache.stats()}")
             self.counter.reset_count()
 
     def handle_k_m(self, event):
@@ -0,0 +1,281 @@
+from typing import List, Callable
+from enum import Enum
+import cv2
+
+from .zone import Zone
+from .ymodel import YoloDetection, YoloProcessor
+from .trapezoid import find_best_fit_trapezoid
+from .geometry import get_polygon_points, get_polygon_coords
+from .platecache import PlateCache
+from ..protocol import PwZoneState
+from shapely import Point, Polygon, STRtree, unary_union
+
+
+class EventType(Enum):
+    ZONE_CHANGED = 0
+    VEHICLE_PARKED = 1
+    LICENSE_PLATE = 2
+
+
+class OccupancyEvent():
+    """something that happened to a zone on a frame """
+
+    def __init__(self, type: EventType, zone: Zone, vehicle_id=None, plate=None, score=None) -> None:
+        self.type = type
+        self.zone = zone
+        self.vehicle_id = vehicle_id
+        # image of a newly found license plate, None when it came from the plate cache
+        self.plate = plate
+        self.score = score
+
+
+class OccupancyResult():
+    """outcome of processing a frame: the detections, the trapezoids fitted to the segmented areas, the zones
+    with their updated state and the events of the frame """
+
+    def __init__(self, source, frame_key, detections: List[YoloDetection], trapezoids, zones: List[Zone],
+                 events: List[OccupancyEvent]) -> None:
+        self.source = source
+        self.frame_key = frame_key
+        self.detections = detections
+        self.trapezoids = trapezoids
+        self.zones = zones
+        self.events = events
+
+
+class OccupancyEngine():
+    """detects objects in frames and keeps the occupancy of the zones up to date, without any drawing. Each
+    processed frame gives an OccupancyResult, which is also handed to the observers (e.g. a canvas).
+    Trapezoids are only fitted to the segmented areas when fit_trapezoids is set, as only drawing and
+    zone editing use them """
+
+    def __init__(self, model: YoloProcessor, zones: List[Zone], plate_model: YoloProcessor | None = None,
+                 plate_cache: PlateCache | None = None, fit_trapezoids=False) -> None:
+        self.model = model
+        self.trapezoids_enabled = fit_trapezoids
+        self.zones = zones
+        self.plate_model = plate_model
+        self.plate_cache = plate_cache if plate_cache is not None else PlateCache()
+        self.trapezoids: List[List[List[int]]] = []
+        self.trapezoid_detections = None
+        self.observers: List[Callable[[OccupancyResult], None]] = []
+
+    def add_observer(self, observer: Callable[[OccupancyResult], None]):
+        ''' Register a function called with the result of every processed frame
+
+        @param  observer    Function taking an OccupancyResult
+
+        @return None '''
+
+        self.observers.append(observer)
+
+    def process(self, source, frame_key=None, detections: List[YoloDetection] | None = None,
+                fps: float = 0) -> OccupancyResult:
+        ''' Detect objects in a frame, update the zones and find the license plates of newly occupied zones
+
+        @param  source        The source image path or video/stream frame
+        @param  frame_key     Optional identity of the source (e.g. path and mtime, or frame id). Detection
+                              results are reused while it is unchanged
+        @param  detections    Optional detections for the source, when inference is done by the caller
+        @param  fps           Frames per second the zone inertia is counted in, 0 to follow every frame
+
+        @return The result of the frame '''
+
+        if detections is None:
+            detections = self.model.predict(source, key=frame_key)
+
+        # memoized detections are returned as the very same list, so the trapezoids still apply
+        if self.trapezoids_enabled and detections is not self.trapezoid_detections:
+            self.trapezoid_detections = detections
+            self.trapezoids = self.fit_trapezoids(detections)
+
+        events = []
+        for zone in self.zones:
+            changed, parked_id = zone.update_occupancy(detections, fps)
+            if parked_id:
+                events.append(OccupancyEvent(EventType.VEHICLE_PARKED, zone, vehicle_id=parked_id))
+            if changed:
+                events.append(OccupancyEvent(EventType.ZONE_CHANGED, zone))
+
+        if self.plate_model:
+            events += self.detect_license_plates(source, detections, frame_key)
+
+        result = OccupancyResult(source, frame_key, detections, self.trapezoids, self.zones, events)
+        for observer in self.observers:
+            observer(result)
+        return result
+
+    def merge_overlapping_polygons(self, polygons: List[Polygon]) -> List[Polygon]:
+        ''' Merge the polygons overlapping each other, directly or through other polygons. The intersecting
+        pairs are found in a single query of a spatial index, grouped with a union-find, and each group is
+        merged at once
+
+        @param  polygons    List of polygons
+
+        @return List of merged polygons, in the order of the first polygon of each group '''
+
+        if len(polygons) < 2:
+            return list(polygons)
+
+        parents = list(range(len(polygons)))
+
+        def find(i):
+            while parents[i] != i:
+                parents[i] = parents[parents[i]]
+                i = parents[i]
+            return i
+
+        pairs = STRtree(polygons).query(polygons, predicate="intersects")
+        for i, j in zip(*pairs.tolist()):
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                parents[max(root_i, root_j)] = min(root_i, root_j)
+
+        groups = {}
+        for i in range(len(polygons)):
+            groups.setdefault(find(i), []).append(polygons[i])
+
+        merged_polygons = []
+        for group in groups.values():
+            if len(group) == 1:
+                merged_polygons.append(group[0])
+                continue
+            union_polygon = unary_union(group)
+            if union_polygon.geom_type == 'Polygon':
+                merged_polygons.append(union_polygon)
+            else:
+                # polygons only touching at a point or along a line don't give a single polygon
+                merged_polygons += self.merge_polygons_pairwise(group)
+
+        return merged_polygons
+
+    def merge_polygons_pairwise(self, polygons: List[Polygon]) -> List[Polygon]:
+        ''' Merge overlapping polygons two at a time, skipping the unions that are not a single polygon
+
+        @param  polygons    List of polygons, emptied by the merge
+
+        @return List of merged polygons '''
+
+        num_polygons = len(polygons)
+        merged_polygons = []
+        while polygons:
+            current_polygon = polygons.pop(0)
+            overlaps = [i for i, poly in enumerate(polygons) if current_polygon.intersects(poly)]
+            for overlap_index in overlaps[::-1]:
+                union_polygon = current_polygon.union(polygons.pop(overlap_index))
+                # Without this check, we sometimes get an unexpected MultiPolygon result of the union
+                # How can this happen if they overlap? It's a mystery wrapped in an enigma.
+                if union_polygon.geom_type == 'Polygon':
+                    current_polygon = union_polygon
+            merged_polygons.append(current_polygon)
+
+        # Recursively merge overlapping polygons
+        if len(merged_polygons) < num_polygons:
+            return self.merge_polygons_pairwise(merged_polygons)
+
+        return merged_polygons
+
+    def fit_trapezoids(self, detections: List[YoloDetection]):
+        ''' Fit trapezoids to the segmentation masks of the detections, merging the overlapping ones
+
+        @param  detections    List of detected objects
+
+        @return List of trapezoids, each a list of 4 points '''
+
+        trapezoids = []
+        for detection in detections:
+            if detection.mask is not None:
+                trapezoid_points = None
+                polygon_points = get_polygon_points(detection.mask)
+                if len(polygon_points) >= 2:
+                    trapezoid_points = find_best_fit_trapezoid(polygon_points)
+                if trapezoid_points:
+                    trapezoids.append(trapezoid_points)
+
+        trapezoid_polygons = [Polygon(trapezoid) for trapezoid in trapezoids]
+        merged_polygons = self.merge_overlapping_polygons(trapezoid_polygons)
+        trapezoids = []
+        for trap_poly in merged_polygons:
+            trap_points = get_polygon_coords(trap_poly)
+            trapezoids.append(find_best_fit_trapezoid(trap_points))
+
+        return trapezoids
+
+    def detect_license_plates(self, source, detections: List[YoloDetection], frame_key=None):
+        ''' Detect license plates for the occupied zones still waiting for one. Tracked vehicles whose
+        plate is already cached are not processed again; the plate model is run once, as a single batch
+        over crops of the remaining vehicles overlapping those zones, and every plate is attributed to
+        the zone containing it
+
+        @param  source        The source image path or video/stream frame
+        @param  detections    List of objects detected in the source
+        @param  frame_key     Optional identity of the source, see process()
+
+        @return List of license plate events '''
+
+        pending_zones = [zone for zone in self.zones if zone.polygon and
+                         zone.status == PwZoneState.Occupied and not zone.license_plate]
+        if not pending_zones:
+            return []
+
+        vehicles = [detection for detection in detections if detection.mask is None and
+                    any(zone.polygon.intersects(detection.rectangle) for zone in pending_zones)]
+        if not vehicles:
+            return []
+
+        # (score, box, vehicle) of every plate found, vehicle is None for plates coming from the cache
+        plates = []
+        crops = []
+        crop_vehicles = []
+        frame = None
+        for vehicle in vehicles:
+            x0, y0 = max(int(vehicle.box[0]), 0), max(int(vehicle.box[1]), 0)
+            entry = self.plate_cache.get(vehicle.id) if vehicle.id else None
+            if entry:
+                plates.append((entry.score, [entry.box[0] + x0, entry.box[1] + y0,
+                                             entry.box[2] + x0, entry.box[3] + y0], None))
+                continue
+
+            if frame is None:
+                frame = cv2.imread(source) if isinstance(source, str) else source
+                if frame is None:
+                    break
+            height, width = frame.shape[:2]
+            x1, y1 = min(int(vehicle.box[2]), width), min(int(vehicle.box[3]), height)
+            if x1 > x0 and y1 > y0:
+                crops.append(frame[y0:y1, x0:x1])
+                crop_vehicles.append((vehicle, x0, y0))
+
+        offsets = [(x0, y0) for _, x0, y0 in crop_vehicles]
+        batch_key = (frame_key, tuple((crop.shape, offset) for crop, offset in zip(crops, offsets))) \
+            if frame_key is not None else None
+        batch = self.plate_model.predict_batch(crops, offsets, key=batch_key)
+        for license_plates, (vehicle, x0, y0) in zip(batch, crop_vehicles):
+            for license_plate in license_plates:
+                box = license_plate.box
+                plates.append((license_plate.score, box, vehicle))
+                if vehicle.id:
+                    crop = frame[int(box[1]):int(box[3]), int(box[0]):int(box[2])].copy()
+                    self.plate_cache.put(vehicle.id, crop, license_plate.score,
+                                         [box[0] - x0, box[1] - y0, box[2] - x0, box[3] - y0])
+
+        best_plates = {}
+        for score, box, vehicle in plates:
+            centroid = Point((box[0] + box[2]) / 2, (box[1] + box[3]) / 2)
+            zone = next((zn for zn in pending_zones if zn.polygon.contains(centroid)), None)
+            if zone and (zone.zoneId not in best_plates or score > best_plates[zone.zoneId][1]):
+                best_plates[zone.zoneId] = (zone, score, box, vehicle)
+
+        events = []
+        for zone, score, box, vehicle in best_plates.values():
+            plate = None
+            # plates from the cache were already reported when first detected. The plate is copied from the
+            # decoded frame without any overlays, as the frame buffer may be reused before it is saved
+            if vehicle is not None:
+                x0, y0 = max(int(box[0]), 0), max(int(box[1]), 0)
+                plate = frame[y0:int(box[3]), x0:int(box[2])].copy()
+            events.append(OccupancyEvent(EventType.LICENSE_PLATE, zone, vehicle_id=vehicle.id if vehicle else None,
+                                         plate=plate, score=score))
+            zone.license_plate = True
+
+        return events
@@ -0,0 +1,145 @@
+from typing import List
+import json
+import sys
+import time
+import cv2
+
+from .ymodel import YoloProcessor
+from .zone import Zone
+from .timeline import OccupancyTimeline
+from .occupancy_engine import OccupancyEngine
+from .vidbuff import PrefetchVideoCapture
+
+
+class OfflineProcessor():
+    """analyses every frame of a recorded video as fast as possible, producing an occupancy timeline """
+
+    def __init__(self, input_path, model: YoloProcessor, zones: List[Zone], output_path: str | None,
+                 sample_every: float | None = None) -> None:
+        self.input_path = input_path
+        self.model = model
+        self.zones = [zone for zone in zones if zone.is_valid()]
+        self.engine = OccupancyEngine(model, self.zones)
+        self.output_path = output_path
+        self.frames = 0
+        self.record_states = None
+
+        cap = cv2.VideoCapture(self.input_path)
+        # inertia is counted in frames of the video, not in processing time
+        self.fps = cap.get(cv2.CAP_PROP_FPS)
+        cap.release()
+        self.timeline = OccupancyTimeline(self.fps)
+
+        # when sampling, only every step-th frame is processed and zone inertia counts samples instead
+        self.step = max(1, round(sample_every * self.fps)) if sample_every else 1
+        self.zone_fps = self.fps / self.step
+
+    def process_frame(self, frame_index: int, frame, record=True):
+        ''' Detect objects in a frame and update the zone states
+
+        @param frame_index    Index of the frame in the video
+        @param frame          The decoded frame
+        @param record         Whether the zone states are recorded in the timeline
+
+        @return None '''
+
+        result = self.engine.process(frame, fps=self.zone_fps)
+        if record:
+            for zone in result.zones:
+                self.timeline.update(zone.zoneId, zone.status, frame_index)
+
+    def get_zone_states(self):
+        ''' Get the state of every zone, with the inertia counted towards its next change
+
+        @param None
+
+        @return Dictionary of (status, inertia) tuples by zone id '''
+
+        return {zone.zoneId: (zone.status, zone.inertia) for zone in self.zones}
+
+    def set_zone_states(self, states):
+        ''' Restore the state of the zones, i.e. where the analysis of the previous segment ended
+
+        @param states    Dictionary of (status, inertia) tuples by zone id, see get_zone_states()
+
+        @return None '''
+
+        for zone in self.zones:
+            if zone.zoneId in states:
+                zone.status, zone.inertia = states[zone.zoneId]
+
+    def get_state_key(self) -> int:
+        ''' Get a compact fingerprint of the state of every zone, to compare the states of two runs
+
+        @param None
+
+        @return Hash of the status and inertia of the zones, the same in every process '''
+
+        return hash(tuple((zone.status.value, zone.inertia) for zone in self.zones))
+
+    def analyse(self, start_frame=0, end_frame=None, record_frame=0, keep_state_keys=False,
+                reference: List[int] | None = None) -> OccupancyTimeline:
+        ''' Process a range of frames of the video
+
+        @param start_frame        Index of the first frame processed
+        @param end_frame          Index of the frame after the last one processed, None for the end of the video
+        @param record_frame       Index of the first frame recorded in the timeline, frames before it only
+                                  bring the zone states up to date. The zone states reached just before it are
+                                  kept in record_states
+        @param keep_state_keys    Keep the state key of the zones before every recorded frame in state_keys
+        @param reference          Optional state keys of another run of the range, from record_frame. The
+                                  analysis stops at the first frame after record_frame where the zone states
+                                  agree with it (kept in converged_frame), as both runs are the same from there
+
+        @return The occupancy timeline of the processed range '''
+
+        cap = PrefetchVideoCapture(self.input_path, start_frame=start_frame, end_frame=end_frame, step=self.step)
+        next_frame = start_frame
+        self.record_states = None
+        self.state_keys = []
+        self.converged_frame = None
+        try:
+            while (item := cap.read()) is not None:
+                frame_index, frame = item
+                if frame_index >= record_frame:
+                    if self.record_states is None:
+                        self.record_states = self.get_zone_states()
+                    if keep_state_keys or reference is not None:
+                        state_key = self.get_state_key()
+                        position = (frame_index - record_frame) // self.step
+                        if reference is not None and 0 < position < len(reference) and \
+                                reference[position] == state_key:
+                            self.converged_frame = next_frame = frame_index
+                            break
+                        if keep_state_keys:
+                            self.state_keys.append(state_key)
+                self.process_frame(frame_index, frame, record=frame_index >= record_frame)
+                self.frames += 1
+                next_frame = frame_index + self.step
+        finally:
+            cap.release()
+
+        if self.record_states is None:
+            self.record_states = self.get_zone_states()
+        self.timeline.close(next_frame)
+        return self.timeline
+
+    def run(self):
+        ''' Process the whole video and write the occupancy timeline
+
+        @param None
+
+        @return None '''
+
+        begin = time.perf_counter()
+        self.analyse()
+        total_seconds = time.perf_counter() - begin
+        rate = self.frames / total_seconds if total_seconds else 0.0
+        print(f"Processed {self.frames} frames (every {self.step}) in {total_seconds:.3f}s ({rate:.2f} frames/s)",
+              file=sys.stderr)
+
+        if self.output_path:
+            self.timeline.write(self.output_path)
+        else:
+            for interval in self.timeline.get_intervals():
+                print(json.dumps(interval))
@@ -8,11 +8,20 @@ from .zone import Zone
 from .base_canvas import Canvas
 from ..protocol import PwZoneState
 from .trapezoid import find_best_fit_trapezoid
+from .occupancy_engine import OccupancyResult
+from .geometry import get_polygon_coords
+
+
+# Distance in pixels the overlap vertices of a zone may move before its hash is drawn again
+OVERLAP_CACHE_TOLERANCE = 2
 
 
 class ParkWatchCanvas(Canvas):
     def __init__(self, width, height, caption, enabled=True, graphics_mask="zod") -> None:
         super().__init__(width, height, caption, enabled, graphics_mask)
+        # zone id -> (overlap polygon, position, hash surface)
+        self.overlap_cache = {}
+        self.zones_key = None
         if self.enabled:
             self.hash_surface = self.__create_hash(spacing=16, width=2)
 
@@ -30,6 +39,31 @@ class ParkWatchCanvas(Canvas):
 
         return hash_surface
 
+    def draw_result(self, result: OccupancyResult):
+        '''Draw the result of a frame processed by the occupancy engine: the zones, the detected objects,
+        the trapezoids fitted to the segmented areas and the overlap of the zones with the objects
+
+        @param  result      Result of the frame from the occupancy engine
+
+        @return None '''
+
+        if not self.enabled:
+            return
+
+        # the zones are composited over everything else, their layer is redrawn before any other drawing
+        self.draw_zones(result.zones)
+
+        for detection in result.detections:
+            if detection.mask is None:
+                self.draw_detection(detection)
+
+        for trap_points in result.trapezoids:
+            self.draw_points(trap_points, color=BLUE, width=0)
+            self.draw_points(trap_points, color=RED, width=2)
+
+        for zone in result.zones:
+            self.draw_zone_overlap(zone)
+
     def draw_detection(self, detection: YoloDetection):
         '''Draw a box corresponding to a detected object on the canvas
 
@@ -41,28 +75,40 @@ class ParkWatchCanvas(Canvas):
             return
 
         color = RED if detection.moving and detection.id != 0 else ORANGE
-        self.pygame.draw.rect(self.screen, color, self.get_box_rect(detection.box), 2)
+        self.mark_dirty(self.pygame.draw.rect(self.screen, color, self.get_box_rect(detection.box), 2))
         pos = self.get_box_caption(detection.box)
         label = f"{detection.name}[{detection.id}]" if detection.id != 0 else f"{detection.name}"
         if "l" in self.graphics_mask.lower():
             self.write_text(f"{label}: {detection.score:.0%} {detection.type}", self.cap_font, pos, color, self.screen)
 
-    def draw_zone(self, zone: Zone):
-        '''Draw a box corresponding to an occupancy zone on the canvas
+    def draw_zones(self, zones: List[Zone]):
+        '''Draw the occupancy zones on the static layer of the canvas. The layer is only drawn again when
+        a zone is added, moved or changes status
 
-        @param  zone      An object corresponding to an area that may be occupied or not
+        @param  zones      Objects corresponding to areas that may be occupied or not
 
         @return None '''
 
-        if not self.enabled or "z" not in self.graphics_mask.lower():
+        if not self.enabled:
+            return
+
+        zones = [zone for zone in zones if zone.is_valid()] if "z" in self.graphics_mask.lower() else []
+        zones_key = tuple((zone.zoneId, tuple(tuple(point) for point in zone.points), zone.status) for zone in zones)
+        if zones_key == self.zones_key:
             return
 
-        if zone.is_valid():
+        self.zones_key = zones_key
+        if not zones:
+            self.set_static_layer(None)
+            return
+
+        layer = self.pygame.Surface((self.width, self.height), self.pygame.SRCALPHA)
+        layer.fill((0, 0, 0, 0))
+        for zone in zones:
             color = get_color(zone.zoneId)
-            self.draw_zone_overlap(zone)
-            self.pygame.draw.polygon(self.screen, color, zone.points,
-                                     width=8 if zone.status == PwZoneState.Occupied else 2)
-            self.write_text(f"{zone.zoneId}", self.sub_font, self.__get_label_position(zone.points), color, self.screen)
+            self.pygame.draw.polygon(layer, color, zone.points, width=8 if zone.status == PwZoneState.Occupied else 2)
+            self.write_text(f"{zone.zoneId}", self.sub_font, self.__get_label_position(zone.points), color, layer)
+        self.set_static_layer(layer)
 
     def draw_zone_overlap(self, zone: Zone):
         '''Draw a hash corresponding to the area of overlap between a zone and a detected object on the canvas
@@ -71,26 +117,54 @@ class ParkWatchCanvas(Canvas):
 
         @return None '''
 
-        if not self.enabled or "o" not in self.graphics_mask.lower():
+        if not self.enabled or "o" not in self.graphics_mask.lower() or "z" not in self.graphics_mask.lower():
             return
 
-        if zone.overlap:
-            cutout_polygon = self.get_polygon_coords(zone.overlap)
-            cutout_surface = self.pygame.Surface((self.width, self.height), self.pygame.SRCALPHA)
-            cutout_surface.fill(TRANSPARENT)
-            cutout_surface.set_colorkey(TRANSPARENT)
-            self.pygame.draw.polygon(cutout_surface, NON_TRANSPARENT, cutout_polygon)
-            hash_surface = self.hash_surface.copy()
-            self.pygame.draw.polygon(hash_surface, NON_TRANSPARENT, cutout_polygon, self.hash_width)
-
-            cutout_mask = self.pygame.mask.from_surface(cutout_surface)
-            hash_mask = self.pygame.mask.from_surface(hash_surface)
-
-            overlap_mask = hash_mask.overlap_mask(cutout_mask, (0, 0))
-            overlap_surf = overlap_mask.to_surface(setcolor=GRAY)
-            overlap_surf.set_colorkey(TRANSPARENT)
+        if not zone.overlap:
+            self.overlap_cache.pop(zone.zoneId, None)
+            return
 
-            self.screen.blit(overlap_surf, (0, 0))
+        cutout_polygon = get_polygon_coords(zone.overlap)
+        cached = self.overlap_cache.get(zone.zoneId)
+        if not cached or not self.__is_same_geometry(cached[0], cutout_polygon):
+            cached = (cutout_polygon, *self.__create_overlap(cutout_polygon))
+            self.overlap_cache[zone.zoneId] = cached
+
+        _, position, overlap_surf = cached
+        if overlap_surf:
+            self.mark_dirty(self.screen.blit(overlap_surf, position))
+
+    def __create_overlap(self, cutout_polygon: List[Tuple[int, int]]):
+        # only the bounding rectangle of the polygon (and its outline) is hashed
+        left = min(x for x, _ in cutout_polygon) - self.hash_width
+        top = min(y for _, y in cutout_polygon) - self.hash_width
+        right = max(x for x, _ in cutout_polygon) + self.hash_width + 1
+        bottom = max(y for _, y in cutout_polygon) + self.hash_width + 1
+        rect = self.pygame.Rect(left, top, right - left, bottom - top).clip(self.hash_surface.get_rect())
+        if rect.width == 0 or rect.height == 0:
+            return rect.topleft, None
+
+        local_polygon = [(x - rect.x, y - rect.y) for x, y in cutout_polygon]
+        cutout_surface = self.pygame.Surface(rect.size, self.pygame.SRCALPHA)
+        cutout_surface.fill(TRANSPARENT)
+        cutout_surface.set_colorkey(TRANSPARENT)
+        self.pygame.draw.polygon(cutout_surface, NON_TRANSPARENT, local_polygon)
+        # the hash is taken from the full-screen pattern, so it lines up across zones
+        hash_surface = self.hash_surface.subsurface(rect).copy()
+        self.pygame.draw.polygon(hash_surface, NON_TRANSPARENT, local_polygon, self.hash_width)
+
+        cutout_mask = self.pygame.mask.from_surface(cutout_surface)
+        hash_mask = self.pygame.mask.from_surface(hash_surface)
+
+        overlap_mask = hash_mask.overlap_mask(cutout_mask, (0, 0))
+        overlap_surf = overlap_mask.to_surface(setcolor=GRAY)
+        overlap_surf.set_colorkey(TRANSPARENT)
+        return rect.topleft, overlap_surf
+
+    def __is_same_geometry(self, points: List[Tuple[int, int]], other: List[Tuple[int, int]]):
+        return len(points) == len(other) and all(abs(x0 - x1) <= OVERLAP_CACHE_TOLERANCE and
+                                                 abs(y0 - y1) <= OVERLAP_CACHE_TOLERANCE
+                                                 for (x0, y0), (x1, y1) in zip(points, other))
 
     def draw_mode_text(self, text: str):
         '''Update the mode text that will be displayed on the canvas
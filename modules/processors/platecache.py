@@ -0,0 +1,84 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import List
+
+
+PLATE_CACHE_TTL_SECONDS = 300
+PLATE_CACHE_SIZE = 256
+
+
+class PlateCacheEntry():
+    def __init__(self, crop, score, box: List[float]) -> None:
+        self.crop = crop
+        self.score = score
+        self.box = box
+        self.timestamp = datetime.now()
+
+    def age(self):
+        ''' Get the time elapsed since the entry was last stored
+
+        @param None
+
+        @return Age of the entry in seconds '''
+
+        return (datetime.now() - self.timestamp).total_seconds()
+
+
+class PlateCache():
+    """keeps the best license plate found for each tracked vehicle, evicting the least recently used """
+
+    def __init__(self, ttl=PLATE_CACHE_TTL_SECONDS, size=PLATE_CACHE_SIZE) -> None:
+        self.ttl = ttl
+        self.size = size
+        self.entries: OrderedDict[int, PlateCacheEntry] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, track_id: int) -> PlateCacheEntry | None:
+        ''' Look up the license plate of a tracked vehicle
+
+        @param track_id    Tracking id of the vehicle
+
+        @return The cached entry, or None if the vehicle is unknown or its entry expired '''
+
+        entry = self.entries.get(track_id)
+        if entry and entry.age() > self.ttl:
+            del self.entries[track_id]
+            entry = None
+
+        if entry:
+            self.entries.move_to_end(track_id)
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        return entry
+
+    def put(self, track_id: int, crop, score, box: List[float]):
+        ''' Store a license plate for a tracked vehicle, unless a better one is already cached
+
+        @param track_id    Tracking id of the vehicle
+        @param crop        Image of the license plate
+        @param score       Detection score of the license plate
+        @param box         Box of the license plate in xyxy format, relative to the vehicle box
+
+        @return None '''
+
+        entry = self.entries.get(track_id)
+        if entry and entry.age() <= self.ttl and entry.score >= score:
+            entry.timestamp = datetime.now()
+        else:
+            self.entries[track_id] = PlateCacheEntry(crop, score, box)
+        self.entries.move_to_end(track_id)
+
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        ''' Get the usage statistics of the cache
+
+        @param None
+
+        @return Dictionary with the hit and miss counts and the number of cached vehicles '''
+
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
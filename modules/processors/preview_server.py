@@ -0,0 +1,177 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Callable
+import threading
+import json
+import time
+import cv2
+
+from .sinks import FrameSink
+from .zone import Zone
+
+
+PREVIEW_FPS = 5.0
+PREVIEW_SCALE = 0.5
+PREVIEW_JPEG_QUALITY = 70
+PREVIEW_BOUNDARY = "frame"
+# The preview is not authenticated, it is only served on the local host unless another address is given
+PREVIEW_HOST = "127.0.0.1"
+# Clients waiting for a frame check this often whether the server is stopping
+PREVIEW_CLIENT_TIMEOUT = 1.0
+
+PREVIEW_PAGE = b"""<html><head><title>Park Detect</title></head>
+<body style="margin:0;background:#000"><img src="/stream.mjpg" style="width:100%"></body></html>"""
+
+
+class PreviewRequestHandler(BaseHTTPRequestHandler):
+    """serves the preview page, the MJPEG stream of annotated frames and the zone states """
+
+    server: "PreviewHTTPServer"
+
+    def do_GET(self):
+        preview = self.server.preview
+        if self.path == "/":
+            self.send_content("text/html", PREVIEW_PAGE)
+        elif self.path == "/zones.json":
+            self.send_content("application/json", json.dumps(preview.get_zones()).encode())
+        elif self.path == "/stream.mjpg":
+            self.send_stream(preview)
+        else:
+            self.send_error(404)
+
+    def send_content(self, content_type: str, content: bytes):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_stream(self, preview: "PreviewServer"):
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={PREVIEW_BOUNDARY}")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        preview.add_client()
+        try:
+            sequence = 0
+            while preview.running:
+                jpeg, sequence = preview.wait_jpeg(sequence, PREVIEW_CLIENT_TIMEOUT)
+                if jpeg is None:
+                    continue
+                self.wfile.write(f"--{PREVIEW_BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                 f"Content-Length: {len(jpeg)}\r\n\r\n".encode())
+                self.wfile.write(jpeg)
+                self.wfile.write(b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            preview.remove_client()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PreviewHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, preview: "PreviewServer") -> None:
+        super().__init__(address, PreviewRequestHandler)
+        self.preview = preview
+
+
+class PreviewServer(FrameSink):
+    """serves the annotated frames as an MJPEG stream over HTTP, along with the zone states as JSON. Frames
+    are only wanted while a client is watching, at a reduced rate, and are scaled and JPEG encoded on the
+    writer thread of the sink """
+
+    def __init__(self, port: int, zones_source: Callable[[], List[Zone]], fps=PREVIEW_FPS, scale=PREVIEW_SCALE,
+                 host=PREVIEW_HOST) -> None:
+        ''' Start the HTTP server
+
+        @param port            Port the preview is served on
+        @param zones_source    Function returning the current zones, which are replaced when they are reloaded
+        @param fps             Maximum frame rate of the preview
+        @param scale           Scale factor applied to the frames before they are encoded
+        @param host            Address the server listens on
+
+        @return None '''
+
+        self.zones_source = zones_source
+        self.frame_interval = 1.0 / fps
+        self.scale = scale
+        self.clients = 0
+        self.last_submit = 0.0
+        self.jpeg = None
+        self.sequence = 0
+        # only the latest frame matters, older ones are dropped
+        super().__init__(f"preview :{port}", queue_size=1)
+
+        self.server = PreviewHTTPServer((host, port), self)
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        print(f"Preview available on http://{host}:{port}/")
+
+    def wants_frame(self) -> bool:
+        ''' Check whether a frame should be submitted now: a client is watching and the preview interval
+        has passed since the previous frame. Nothing needs to be exported while this is False
+
+        @param None
+
+        @return True if a frame should be submitted '''
+
+        if not self.clients:
+            return False
+
+        now = time.monotonic()
+        if now - self.last_submit < self.frame_interval:
+            return False
+
+        self.last_submit = now
+        return True
+
+    def add_client(self):
+        with self.condition:
+            self.clients += 1
+
+    def remove_client(self):
+        with self.condition:
+            self.clients -= 1
+
+    def wait_jpeg(self, sequence: int, timeout: float):
+        ''' Wait for a frame newer than the one a client received last
+
+        @param sequence    Sequence number of the last frame received by the client
+        @param timeout     Maximum time to wait, in seconds
+
+        @return Tuple of the JPEG image (None on timeout) and its sequence number '''
+
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.sequence > sequence or not self.running, timeout):
+                return None, sequence
+            return self.jpeg, self.sequence
+
+    def get_zones(self):
+        ''' Get the state of the zones
+
+        @param None
+
+        @return List of dictionaries with the id, status, count and points of every zone '''
+
+        return [{"zoneId": zone.zoneId, "status": zone.status.name, "count": zone.count, "points": zone.points}
+                for zone in list(self.zones_source())]
+
+    def write(self, frame):
+        if self.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, PREVIEW_JPEG_QUALITY])
+        if not ok:
+            raise RuntimeError("JPEG encoding failed")
+
+        with self.condition:
+            self.jpeg = jpeg.tobytes()
+            self.sequence += 1
+            self.condition.notify_all()
+
+    def close_output(self):
+        self.server.shutdown()
+        self.server.server_close()
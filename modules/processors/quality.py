@@ -0,0 +1,134 @@
+from datetime import datetime
+from typing import List
+from enum import Enum
+import time
+
+from .ymodel import YoloProcessor
+from .base_canvas import Canvas
+
+
+# Weight of the latest frame in the smoothed latency
+QUALITY_LATENCY_SMOOTHING = 0.1
+# Consecutive frames over the budget before degrading one level
+QUALITY_DEGRADE_FRAMES = 15
+# Consecutive frames under the headroom before restoring one level
+QUALITY_RESTORE_FRAMES = 90
+# Fraction of the frame budget the latency must stay under before restoring a level
+QUALITY_HEADROOM = 0.6
+# Graphics disabled at the REDUCED_GRAPHICS level: overlap hashing and labels
+QUALITY_GRAPHICS_DISABLED = "ol"
+# Model image size at the REDUCED_IMAGE_SIZE level, as a fraction of the configured size
+QUALITY_IMGSZ_SCALE = 0.5
+QUALITY_IMGSZ_MIN = 320
+QUALITY_IMGSZ_STRIDE = 32
+
+
+class QualityLevel(Enum):
+    FULL = 0
+    REDUCED_GRAPHICS = 1
+    REDUCED_IMAGE_SIZE = 2
+    ALTERNATE_INFERENCE = 3
+
+
+class QualityController():
+    """watches the latency of every frame against a target frame rate, degrading the processing one level at a
+    time while the pipeline falls behind and restoring it once there is headroom again. Each level keeps those
+    below it: fewer graphics, then a smaller image size for all the models (object, zone and license plate),
+    then inference only on every other frame. The current level is shown on the canvas while degraded """
+
+    def __init__(self, target_fps: float, models: List[YoloProcessor], canvas: Canvas) -> None:
+        self.budget = 1.0 / target_fps
+        self.canvas = canvas
+        self.level = QualityLevel.FULL
+        # (model, configured image size, reduced image size), a model given twice is only kept once
+        self.models = [(model, model.imgsz, max(QUALITY_IMGSZ_MIN, int(model.imgsz * QUALITY_IMGSZ_SCALE)
+                                               // QUALITY_IMGSZ_STRIDE * QUALITY_IMGSZ_STRIDE))
+                       for model in dict.fromkeys(model for model in models if model is not None)]
+        self.disabled_graphics = ""
+        self.latency = None
+        self.frame_begin = None
+        self.over_budget = 0
+        self.under_headroom = 0
+        self.frame_count = 0
+        self.skipped = 0
+        self.changes = 0
+
+    def begin_frame(self) -> bool:
+        ''' Start timing a frame
+
+        @param  None
+
+        @return True if inference must run on this frame, False to reuse the previous detections '''
+
+        self.frame_begin = time.perf_counter()
+        self.frame_count += 1
+        infer = self.level != QualityLevel.ALTERNATE_INFERENCE or self.frame_count % 2 == 0
+        if not infer:
+            self.skipped += 1
+        return infer
+
+    def end_frame(self):
+        ''' Stop timing a frame and change the quality level if needed
+
+        @param  None
+
+        @return None '''
+
+        if self.frame_begin is None:
+            return
+
+        latency = time.perf_counter() - self.frame_begin
+        self.frame_begin = None
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += QUALITY_LATENCY_SMOOTHING * (latency - self.latency)
+
+        self.over_budget = self.over_budget + 1 if self.latency > self.budget else 0
+        self.under_headroom = self.under_headroom + 1 if self.latency < self.budget * QUALITY_HEADROOM else 0
+
+        if self.over_budget >= QUALITY_DEGRADE_FRAMES and self.level != QualityLevel.ALTERNATE_INFERENCE:
+            self.set_level(QualityLevel(self.level.value + 1))
+        elif self.under_headroom >= QUALITY_RESTORE_FRAMES and self.level != QualityLevel.FULL:
+            self.set_level(QualityLevel(self.level.value - 1))
+
+    def set_level(self, level: QualityLevel):
+        ''' Apply a quality level
+
+        @param  level    The new quality level
+
+        @return None '''
+
+        if level.value >= QualityLevel.REDUCED_GRAPHICS.value:
+            if not self.disabled_graphics:
+                self.disabled_graphics = ''.join([c for c in QUALITY_GRAPHICS_DISABLED
+                                                  if c in self.canvas.graphics_mask])
+                self.canvas.graphics_mask = ''.join([c for c in self.canvas.graphics_mask
+                                                     if c not in QUALITY_GRAPHICS_DISABLED])
+        elif self.disabled_graphics:
+            # graphics toggled back on meanwhile are not added twice
+            self.canvas.graphics_mask += ''.join([c for c in self.disabled_graphics
+                                                  if c not in self.canvas.graphics_mask])
+            self.disabled_graphics = ""
+
+        for model, imgsz, reduced_imgsz in self.models:
+            model.imgsz = reduced_imgsz if level.value >= QualityLevel.REDUCED_IMAGE_SIZE.value else imgsz
+
+        self.canvas.draw_status_text(f"Quality: {level.name}" if level != QualityLevel.FULL else None)
+        print(f"{datetime.now()} Quality level: {self.level.name} -> {level.name} "
+              f"(latency {self.latency * 1000:.1f}ms, budget {self.budget * 1000:.1f}ms)")
+        self.level = level
+        self.over_budget = 0
+        self.under_headroom = 0
+        self.changes += 1
+
+    def stats(self):
+        ''' Get the current quality level, the smoothed frame latency and the number of level changes and
+        frames processed without inference
+
+        @param  None
+
+        @return Dictionary with the quality statistics '''
+
+        return {"level": self.level.name, "latency_ms": round((self.latency or 0.0) * 1000, 1),
+                "budget_ms": round(self.budget * 1000, 1), "changes": self.changes, "skipped": self.skipped}
@@ -1,21 +1,24 @@
 import cv2
-import pygame
+
+from .sinks import FrameSink, SINK_QUEUE_SIZE
 
 
 ###############################################
 # From https://github.com/tdrmk/pygame_recorder
 ###############################################
-class ScreenRecorder:
+class ScreenRecorder(FrameSink):
     """
         This class is used to record a PyGame surface and save it to a video file.
+        Frames are encoded on the writer thread of the sink.
     """
-    def __init__(self, width, height, fps, out_file):
+    def __init__(self, width, height, fps, out_file, queue_size=SINK_QUEUE_SIZE):
         ''' Initialize the recorder with parameters of the surface.
 
         @param width      Width of the surface to capture
         @param height     Height of the surface to capture
         @param fps        Frames per second
         @param out_file   Output file to save the recording
+        @param queue_size Number of frames queued before the oldest ones are dropped
 
         @return None '''
 
@@ -25,22 +28,21 @@ class ScreenRecorder:
         # define the codec and create a video writer object
         four_cc = cv2.VideoWriter_fourcc(*'H264')
         self.video = cv2.VideoWriter(out_file, four_cc, float(fps), (width, height))
+        super().__init__(f"recording {out_file}", queue_size)
 
-    def capture_frame(self, surf):
-        ''' Call this method every frame, pass in the pygame surface to capture.
-        Note: surface must have the dimensions specified in the constructor.
+    def write_frame(self, frame):
+        ''' Call this method every frame, pass in the frame exported from the canvas.
+        Note: frame must have the dimensions specified in the constructor.
 
-        @param surf pygame surface to capture
+        @param frame BGR frame to write, as returned by Canvas.export_frame()
 
         @return None'''
 
-        # transform the pixels to the format used by open-cv
-        pixels = cv2.rotate(pygame.surfarray.pixels3d(surf), cv2.ROTATE_90_CLOCKWISE)
-        pixels = cv2.flip(pixels, 1)
-        pixels = cv2.cvtColor(pixels, cv2.COLOR_RGB2BGR)
+        # queue the frame, it is written in the background
+        self.submit(frame)
 
-        # write the frame
-        self.video.write(pixels)
+    def write(self, frame):
+        self.video.write(frame)
 
     def end_recording(self):
         ''' Call this method to stop recording.
@@ -48,7 +50,11 @@ class ScreenRecorder:
         @param None
 
         @return None'''
-        # stop recording
+        # write the queued frames and stop recording
+        self.close()
+        print(f"Recording frames: {self.stats()}")
+
+    def close_output(self):
         self.video.release()
 
 # References
@@ -0,0 +1,187 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+from math import ceil
+import multiprocessing
+import json
+import os
+import sys
+import time
+import cv2
+
+from .ymodel import YoloProcessor
+from .zone import read_zones_from_file, ZONE_INERTIA_SECONDS
+from .timeline import OccupancyTimeline
+from .offline_processor import OfflineProcessor
+
+
+# Model of the worker process, loaded once by the pool initializer
+worker_model: YoloProcessor = None
+
+
+def init_segment_worker(model_args, threads: int):
+    ''' Initialize a segment worker process: limit its CPU threads and load its own model
+
+    @param  model_args    Arguments used to create the YoloProcessor
+    @param  threads       Number of CPU threads the worker may use for inference
+
+    @return None '''
+
+    global worker_model
+
+    import torch
+    torch.set_num_threads(threads)
+    # decoding already runs on its own thread, keep OpenCV from spawning more
+    cv2.setNumThreads(1)
+    worker_model = YoloProcessor(*model_args)
+
+
+class SegmentResult():
+    """timeline of a segment, with the zone states just before its first recorded frame and after its last
+    frame, used to check that consecutive segments agree, and the state keys of its recorded frames """
+
+    def __init__(self, timeline: OccupancyTimeline, record_states, end_states, frames: int,
+                 state_keys: List[int], converged_frame: int | None = None) -> None:
+        self.timeline = timeline
+        self.record_states = record_states
+        self.end_states = end_states
+        self.frames = frames
+        self.state_keys = state_keys
+        self.converged_frame = converged_frame
+
+
+def analyse_segment(input_path, zones_cfg, sample_every, start_frame, end_frame, record_frame,
+                    initial_states=None, reference: List[int] | None = None) -> SegmentResult:
+    ''' Analyse one segment of the video in a worker process
+
+    @param  input_path        Path of the video file
+    @param  zones_cfg         Path to the zones config file
+    @param  sample_every      Sampling interval in seconds, None to process every frame
+    @param  start_frame       First frame processed, including the warm-up overlap
+    @param  end_frame         Frame after the last one processed
+    @param  record_frame      First frame of the segment itself
+    @param  initial_states    Optional zone states at start_frame, see OfflineProcessor.get_zone_states()
+    @param  reference         Optional state keys of a previous run of the segment, the analysis stops once
+                              the zone states agree with it, see OfflineProcessor.analyse()
+
+    @return The result of the segment '''
+
+    processor = OfflineProcessor(input_path, worker_model, read_zones_from_file(zones_cfg), None, sample_every)
+    if initial_states:
+        processor.set_zone_states(initial_states)
+    timeline = processor.analyse(start_frame, end_frame, record_frame, keep_state_keys=True, reference=reference)
+    return SegmentResult(timeline, processor.record_states, processor.get_zone_states(), processor.frames,
+                         processor.state_keys, processor.converged_frame)
+
+
+class SegmentProcessor():
+    """splits a recorded video into segments analysed by parallel worker processes """
+
+    def __init__(self, input_path, model_args, zones_cfg, output_path: str | None, workers: int,
+                 sample_every: float | None = None) -> None:
+        self.input_path = input_path
+        self.sample_every = sample_every
+        self.model_args = model_args
+        self.zones_cfg = zones_cfg
+        self.output_path = output_path
+        self.workers = workers
+
+        cap = cv2.VideoCapture(self.input_path)
+        if not cap.isOpened():
+            raise RuntimeError(f"Unable to open {self.input_path}")
+        self.fps = cap.get(cv2.CAP_PROP_FPS)
+        self.frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        self.step = max(1, round(sample_every * self.fps)) if sample_every else 1
+
+    def get_segments(self):
+        ''' Split the video into one segment per worker. Each segment starts with an overlap of one zone
+        inertia window, so the zone states have usually settled by the first frame of the segment itself
+
+        @param  None
+
+        @return List of (start_frame, end_frame, record_frame) tuples, end_frame is None for the last segment '''
+
+        # some containers don't report a frame count, the whole video is then analysed in a single run
+        if self.frame_count <= 0:
+            return [(0, None, 0)]
+
+        # boundaries are kept on the sampling grid, so segments sample the same frames as a single run
+        overlap = ceil(ceil(ZONE_INERTIA_SECONDS * self.fps) / self.step) * self.step
+        length = ceil(ceil(self.frame_count / self.workers) / self.step) * self.step
+        segments = []
+        for record_frame in range(0, self.frame_count, length):
+            # the frame count reported by the container may be approximate, the last segment reads to the end
+            end_frame = record_frame + length if record_frame + length < self.frame_count else None
+            segments.append((max(record_frame - overlap, 0), end_frame, record_frame))
+        return segments
+
+    def splice(self, result: SegmentResult, rerun: SegmentResult) -> SegmentResult:
+        ''' Combine the result of a segment with its rerun from other initial states: the rerun is used up
+        to the frame where the states agree, and the original result from there
+
+        @param  result    The previous result of the segment
+        @param  rerun     The rerun of the segment
+
+        @return The result of the segment from the initial states of the rerun '''
+
+        frames = result.frames + rerun.frames
+        if rerun.converged_frame is None:
+            rerun.frames = frames
+            return rerun
+
+        timeline = OccupancyTimeline.stitch([rerun.timeline, result.timeline.clip(rerun.converged_frame)])
+        state_keys = rerun.state_keys + result.state_keys[len(rerun.state_keys):]
+        return SegmentResult(timeline, rerun.record_states, result.end_states, frames, state_keys)
+
+    def run(self):
+        ''' Analyse all the segments in parallel and write the stitched occupancy timeline
+
+        @param  None
+
+        @return None '''
+
+        segments = self.get_segments()
+        workers = min(self.workers, len(segments))
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        if self.frame_count <= 0:
+            print(f"Frame count of {self.input_path} unknown, processing it in a single run", file=sys.stderr)
+        print(f"Processing {len(segments)} segments of {self.input_path} with {workers} workers "
+              f"({threads} threads each)", file=sys.stderr)
+
+        begin = time.perf_counter()
+        reruns = 0
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=init_segment_worker, initargs=(self.model_args, threads)) as pool:
+            futures = [pool.submit(analyse_segment, self.input_path, self.zones_cfg, self.sample_every, *segment)
+                       for segment in segments]
+            results = [future.result() for future in futures]
+
+            # The warm-up overlap starts from empty zones, which doesn't always bring a zone to the state (and
+            # inertia) a single run has at the segment boundary. A segment whose states at its first frame
+            # differ from where the previous segment ended is analysed again from those states, only until
+            # they agree with its own run. The reruns are independent and run in parallel, only a rerun that
+            # never agrees changes the end states, and the next segment is then checked again
+            while pending := [index for index in range(1, len(results))
+                              if results[index].record_states != results[index - 1].end_states]:
+                futures = {}
+                for index in pending:
+                    _, end_frame, record_frame = segments[index]
+                    futures[index] = pool.submit(analyse_segment, self.input_path, self.zones_cfg,
+                                                 self.sample_every, record_frame, end_frame, record_frame,
+                                                 results[index - 1].end_states, results[index].state_keys)
+                for index, future in futures.items():
+                    results[index] = self.splice(results[index], future.result())
+                reruns += len(pending)
+
+        timeline = OccupancyTimeline.stitch([result.timeline for result in results])
+        total_seconds = time.perf_counter() - begin
+        frames = sum(result.frames for result in results)
+        rate = frames / total_seconds if total_seconds else 0.0
+        print(f"Processed {frames} frames in {total_seconds:.3f}s ({rate:.2f} frames/s), "
+              f"{reruns} segment starts analysed again", file=sys.stderr)
+
+        if self.output_path:
+            timeline.write(self.output_path)
+        else:
+            for interval in timeline.get_intervals():
+                print(json.dumps(interval))
@@ -0,0 +1,266 @@
+from multiprocessing import shared_memory
+import multiprocessing
+import numpy as np
+import time
+import cv2
+
+from .vidbuff import ReconnectPolicy, StreamHealth, RECONNECT_ATTEMPTS_BEFORE_DOWN
+from ..scheduling import SchedulingPlan, set_plan, get_plan, pin_current_thread
+
+
+# Number of frame slots in the ring: one held by the consumer, one published, the rest being decoded into
+FRAME_RING_SLOTS = 4
+DECODER_STOP_TIMEOUT = 5.0
+
+
+class FrameRingState():
+    """synchronization state shared between the decoder process and the consumer of the frame ring """
+
+    def __init__(self, ctx) -> None:
+        self.condition = ctx.Condition()
+        self.stop = ctx.Event()
+        # guarded by the condition
+        self.latest = ctx.Value('i', -1, lock=False)
+        self.consumed = ctx.Value('i', -1, lock=False)
+        self.sequence = ctx.Value('q', 0, lock=False)
+        self.consumed_sequence = ctx.Value('q', 0, lock=False)
+        self.frames_read = ctx.Value('q', 0, lock=False)
+        self.frames_dropped = ctx.Value('q', 0, lock=False)
+        # only written by the decoder process
+        self.health = ctx.Value('i', StreamHealth.CONNECTED.value, lock=False)
+        self.reconnects = ctx.Value('q', 0, lock=False)
+        self.outages = ctx.Value('q', 0, lock=False)
+        self.outage_total = ctx.Value('d', 0.0, lock=False)
+        self.outage_max = ctx.Value('d', 0.0, lock=False)
+
+
+class FrameRingDecoder():
+    """decodes a video or stream into the slots of the shared frame ring, runs in the decoder process """
+
+    def __init__(self, cap, input_path, is_video: bool, ring, state: FrameRingState) -> None:
+        self.cap = cap
+        self.input_path = input_path
+        self.is_video = is_video
+        self.ring = ring
+        self.state = state
+        self.reconnect_policy = ReconnectPolicy()
+        # start of the ongoing outage, which only ends with a frame read, not when the stream opens
+        self.outage_begin = None
+        self.frame_delay = 1.0 / self.cap.get(cv2.CAP_PROP_FPS) if is_video else 0.0
+
+    def run(self):
+        ''' Decode frames until the consumer asks to stop
+
+        @param None
+
+        @return None '''
+
+        while not self.state.stop.is_set():
+            slot = self._next_slot()
+            view = self.ring[slot]
+            ret, frame = self.cap.read(image=view)
+            if not ret:
+                print(f"Error: failed to read {self.input_path}")
+                # a video file simply loops back to its start
+                if not self.is_video or not self._open():
+                    self._reconnect()
+                continue
+
+            if frame.ctypes.data != view.ctypes.data:
+                # the stream geometry changed since the ring was sized, scale into the slot
+                cv2.resize(frame, (view.shape[1], view.shape[0]), dst=view)
+
+            self._publish(slot)
+            if self.outage_begin is not None:
+                self._reconnected()
+
+            if self.frame_delay:
+                time.sleep(self.frame_delay)
+
+        self.cap.release()
+
+    def _next_slot(self):
+        with self.state.condition:
+            return next(slot for slot in range(len(self.ring))
+                        if slot != self.state.latest.value and slot != self.state.consumed.value)
+
+    def _publish(self, slot):
+        state = self.state
+        with state.condition:
+            if state.sequence.value > state.consumed_sequence.value:
+                state.frames_dropped.value += 1   # previous (unprocessed) frame is discarded
+            state.latest.value = slot
+            state.sequence.value += 1
+            state.frames_read.value += 1
+            state.condition.notify_all()
+
+    def _open(self) -> bool:
+        self.cap.release()
+        self.cap = cv2.VideoCapture(self.input_path)
+        return self.cap.isOpened()
+
+    def _reconnect(self):
+        # retry with backoff until the stream opens again (or the consumer asks to stop). The backoff goes on
+        # until a frame is read, a stream that opens but fails every read still ends up DOWN
+        if self.outage_begin is None:
+            self.outage_begin = time.monotonic()
+            self.state.health.value = StreamHealth.RECONNECTING.value
+        while True:
+            if self.reconnect_policy.attempts >= RECONNECT_ATTEMPTS_BEFORE_DOWN:
+                self.state.health.value = StreamHealth.DOWN.value
+
+            delay = self.reconnect_policy.next_delay()
+            print(f"Reconnecting to {self.input_path} in {delay:.1f}s")
+            if self.state.stop.wait(delay):
+                break
+
+            if self._open():
+                return
+
+    def _reconnected(self):
+        # the first frame after an outage ends it
+        outage = time.monotonic() - self.outage_begin
+        self.state.outages.value += 1
+        self.state.outage_total.value += outage
+        self.state.outage_max.value = max(self.state.outage_max.value, outage)
+        self.state.reconnects.value += 1
+        self.state.health.value = StreamHealth.CONNECTED.value
+        self.reconnect_policy.reset()
+        self.outage_begin = None
+        print(f"Reconnected to {self.input_path} after {outage:.1f}s")
+
+
+def run_ring_decoder(input_path, is_video: bool, slots: int, conn, state: FrameRingState,
+                     plan: SchedulingPlan | None = None):
+    ''' Entry point of the decoder process. The stream properties are sent to the consumer, which
+    replies with the name of the shared memory holding the frame ring
+
+    @param  input_path    Path or URL of the video or stream
+    @param  is_video      True for a video file, which is paced to its frame rate
+    @param  slots         Number of frame slots in the ring
+    @param  conn          Pipe connection to the consumer
+    @param  state         Synchronization state shared with the consumer
+    @param  plan          Scheduling plan of the consumer process
+
+    @return None '''
+
+    # this process only decodes, torch and the BLAS libraries are left alone
+    set_plan(plan, ["opencv"])
+    pin_current_thread("decode")
+
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        conn.send(None)
+        return
+
+    conn.send({
+        cv2.CAP_PROP_FPS: cap.get(cv2.CAP_PROP_FPS),
+        cv2.CAP_PROP_FRAME_WIDTH: cap.get(cv2.CAP_PROP_FRAME_WIDTH),
+        cv2.CAP_PROP_FRAME_HEIGHT: cap.get(cv2.CAP_PROP_FRAME_HEIGHT),
+    })
+    # the consumer owns the shared memory and unlinks it. This process shares the consumer's resource tracker,
+    # attaching registers the segment there again, which is harmless
+    shm = shared_memory.SharedMemory(name=conn.recv())
+
+    width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    ring = np.ndarray((slots, height, width, 3), dtype=np.uint8, buffer=shm.buf)
+    try:
+        FrameRingDecoder(cap, input_path, is_video, ring, state).run()
+    finally:
+        del ring
+        shm.close()
+
+
+class SharedMemoryVideoCapture:
+    """decodes in a child process into a shared memory ring of frames and only provides a get to the
+    latest frame, as a view of the ring without copying it """
+
+    def __init__(self, input_path, is_video: bool, slots=FRAME_RING_SLOTS):
+        self.input_path = input_path
+
+        ctx = multiprocessing.get_context("spawn")
+        self.state = FrameRingState(ctx)
+        conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=run_ring_decoder, daemon=True,
+                                   args=(input_path, is_video, slots, child_conn, self.state, get_plan()))
+        self.process.start()
+
+        self.properties = conn.recv()
+        if self.properties is None:
+            self.process.join()
+            raise RuntimeError(f"Unable to open {self.input_path}")
+
+        width = int(self.properties[cv2.CAP_PROP_FRAME_WIDTH])
+        height = int(self.properties[cv2.CAP_PROP_FRAME_HEIGHT])
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * height * width * 3)
+        self.ring = np.ndarray((slots, height, width, 3), dtype=np.uint8, buffer=self.shm.buf)
+        conn.send(self.shm.name)
+
+    @property
+    def health(self) -> StreamHealth:
+        return StreamHealth(self.state.health.value)
+
+    def get(self, param):
+        ''' Get properties of the video or stream being processed
+
+        @param param    The property being requested, one of fps, frame width or frame height
+
+        @return The property being requested, or 0 if it is not available '''
+
+        return self.properties.get(param, 0)
+
+    def release(self):
+        ''' Stop the decoder process and free the frame ring
+
+        @param None
+
+        @return None '''
+
+        self.state.stop.set()
+        self.process.join(DECODER_STOP_TIMEOUT)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+        del self.ring
+        self.shm.close()
+        self.shm.unlink()
+
+    def read(self, timeout=0.05):
+        ''' Retrieve the latest decoded frame, waiting for one newer than the previously read frame.
+        The frame is a view of the shared ring, its slot is reused once read() is called again
+
+        @param timeout    If no newer frame is available after the timeout period, return None
+
+        @return The latest decoded frame, or None if no newer frame is available '''
+
+        state = self.state
+        with state.condition:
+            if not state.condition.wait_for(lambda: state.sequence.value > state.consumed_sequence.value, timeout):
+                return None
+
+            state.consumed.value = state.latest.value
+            state.consumed_sequence.value = state.sequence.value
+            return self.ring[state.consumed.value]
+
+    def stats(self):
+        ''' Get the number of frames decoded and the number of frames replaced before being read
+
+        @param None
+
+        @return Dictionary with the read and dropped frame counts '''
+
+        with self.state.condition:
+            return {"read": self.state.frames_read.value, "dropped": self.state.frames_dropped.value,
+                    "sequence": self.state.sequence.value}
+
+    def connection_stats(self):
+        ''' Get the connection health along with the reconnection count and outage durations
+
+        @param None
+
+        @return Dictionary with the health, reconnects, outages, and total and longest outage in seconds '''
+
+        return {"health": self.health.name, "reconnects": self.state.reconnects.value,
+                "outages": self.state.outages.value, "outage_total": round(self.state.outage_total.value, 3),
+                "outage_max": round(self.state.outage_max.value, 3)}
@@ -0,0 +1,156 @@
+from abc import ABC, abstractmethod
+from collections import deque
+import subprocess
+import threading
+import cv2
+
+
+SINK_QUEUE_SIZE = 8
+SINK_STOP_TIMEOUT = 10.0
+STREAM_FORMATS = ["bgr24", "yuv420p"]
+
+
+class FrameSink(ABC):
+    """writes frames to an output on a dedicated thread. Frames are queued without waiting, and the oldest
+    queued frame is dropped when the output falls behind, so a stalled output never holds up the caller """
+
+    def __init__(self, name: str, queue_size=SINK_QUEUE_SIZE) -> None:
+        self.name = name
+        self.frames = deque(maxlen=queue_size)
+        self.condition = threading.Condition()
+        self.running = True
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.thread = threading.Thread(target=self._writer, daemon=True)
+        self.thread.start()
+
+    def submit(self, frame):
+        ''' Queue a frame to be written, without waiting for it
+
+        @param frame    BGR frame, must not be modified by the caller afterwards
+
+        @return None '''
+
+        with self.condition:
+            if len(self.frames) == self.frames.maxlen:
+                self.dropped += 1   # the oldest frame is pushed out of the queue
+            self.frames.append(frame)
+            self.condition.notify_all()
+
+    def close(self):
+        ''' Write the frames still queued, stop the writer thread and close the output
+
+        @param None
+
+        @return None '''
+
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join(SINK_STOP_TIMEOUT)
+        if self.thread.is_alive():
+            print(f"Error: {self.name} did not stop, {len(self.frames)} frames not written")
+        self.close_output()
+
+    def stats(self):
+        ''' Get the number of frames written, dropped, and that failed to be written
+
+        @param None
+
+        @return Dictionary with the written, dropped and error counts '''
+
+        with self.condition:
+            return {"written": self.written, "dropped": self.dropped, "errors": self.errors}
+
+    @abstractmethod
+    def write(self, frame):
+        ''' Write a frame to the output, called on the writer thread
+
+        @param frame    BGR frame
+
+        @return None '''
+
+        pass
+
+    @abstractmethod
+    def close_output(self):
+        ''' Close the output once the writer thread has stopped
+
+        @param None
+
+        @return None '''
+
+        pass
+
+    def _writer(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.frames or not self.running)
+                if not self.frames:
+                    break
+                frame = self.frames.popleft()
+
+            try:
+                self.write(frame)
+                with self.condition:
+                    self.written += 1
+            except Exception as e:
+                with self.condition:
+                    self.errors += 1
+                    if self.errors == 1:
+                        print(f"Error: failed to write to {self.name}: {e}")
+
+
+class FfmpegSink(FrameSink):
+    """streams frames to an RTSP server through an ffmpeg process """
+
+    def __init__(self, output_stream: str, width: int, height: int, pix_fmt="bgr24", scale=1.0,
+                 queue_size=SINK_QUEUE_SIZE) -> None:
+        ''' Start the ffmpeg process
+
+        @param output_stream    RTSP URL the stream is published to
+        @param width            Width of the frames submitted
+        @param height           Height of the frames submitted
+        @param pix_fmt          Pixel format sent through the pipe, bgr24 or yuv420p (half the bandwidth)
+        @param scale            Scale factor applied to the frames before they are sent
+        @param queue_size       Number of frames queued before the oldest ones are dropped
+
+        @return None '''
+
+        if pix_fmt not in STREAM_FORMATS:
+            raise ValueError(f"Unsupported stream pixel format: {pix_fmt}")
+
+        self.pix_fmt = pix_fmt
+        self.size = None
+        self.width, self.height = width, height
+        if scale != 1.0:
+            self.size = (round(width * scale), round(height * scale))
+            self.width, self.height = self.size
+        if pix_fmt == "yuv420p":
+            # chroma is subsampled 2x2, the frame dimensions must be even
+            self.width, self.height = self.width // 2 * 2, self.height // 2 * 2
+            if (self.width, self.height) != (width, height):
+                self.size = (self.width, self.height)
+
+        args = [
+            "ffmpeg", "-stream_loop", "-1", "-f", "rawvideo", "-pix_fmt", pix_fmt, "-s",
+            f"{self.width}x{self.height}", "-i", "pipe:0", "-pix_fmt", "yuv420p",
+            "-rtsp_transport", "tcp", "-f", "rtsp", f"{output_stream}"
+        ]
+        self.process = subprocess.Popen(args, stdin=subprocess.PIPE)
+        super().__init__(f"ffmpeg {output_stream}", queue_size)
+
+    def write(self, frame):
+        if self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if self.pix_fmt == "yuv420p":
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420)
+        self.process.stdin.write(frame)
+
+    def close_output(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.process.wait()
@@ -1,11 +1,15 @@
 from typing import List
 from datetime import datetime, timedelta
-import subprocess
 
 from .input_processor import *
 from .ymodel import YoloProcessor
 from .zone import Zone
-from .vidbuff import BufferlessVideoCapture
+from .vidbuff import BufferlessVideoCapture, StreamHealth
+from .shmcapture import SharedMemoryVideoCapture
+from .quality import QualityController
+from .sinks import FfmpegSink
+from .clip_recorder import ClipRecorder, CLIP_PRE_SECONDS, CLIP_POST_SECONDS
+from .preview_server import PreviewServer, PREVIEW_FPS, PREVIEW_SCALE, PREVIEW_HOST
 
 
 class FreezeType(Enum):
@@ -16,17 +20,23 @@ class FreezeType(Enum):
 
 class StreamProcessor(InputProcessor):
     def __init__(self, input_path, input_format, model: YoloProcessor, zone_model: YoloProcessor, plate_model: YoloProcessor,  # noqa
-                 zones: List[Zone], zones_cfg, enable_canvas, output_path, graphics_mask, serial_handler, auto_record) -> None:  # noqa
+                 zones: List[Zone], zones_cfg, enable_canvas, output_path, graphics_mask, serial_handler, auto_record,  # noqa
+                 plate_format="png", decode_process=False, target_fps: float | None = None,
+                 stream_format="bgr24", stream_scale=1.0, clip_dir=None, clip_pre=CLIP_PRE_SECONDS,
+                 clip_post=CLIP_POST_SECONDS, preview_port=None, preview_fps=PREVIEW_FPS,
+                 preview_scale=PREVIEW_SCALE, preview_host=PREVIEW_HOST) -> None:
         super().__init__(zones=zones, obj_model=model, zone_model=zone_model, plate_model=plate_model,
                          zones_cfg=zones_cfg, enable_canvas=enable_canvas, output_path=output_path,
-                         serial_handler=serial_handler)
+                         serial_handler=serial_handler, plate_format=plate_format)
 
         self.zones = zones
         self.input_path = input_path
         self.input_format = input_format
         self.freeze_frame = FreezeType.NOMINAL
 
-        self.cap = BufferlessVideoCapture(self.input_path, self.input_format == MediaFormat.VIDEO)
+        # decoding in a separate process keeps it from competing with inference for the GIL
+        capture_class = SharedMemoryVideoCapture if decode_process else BufferlessVideoCapture
+        self.cap = capture_class(self.input_path, self.input_format == MediaFormat.VIDEO)
         self.fps = self.cap.get(cv2.CAP_PROP_FPS)
         self.screen_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         self.screen_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
@@ -35,14 +45,32 @@ class StreamProcessor(InputProcessor):
                                       "Park Detect",
                                       enable_canvas,
                                       graphics_mask)
+        if enable_canvas:
+            self.engine.add_observer(self.canvas.draw_result)
+
+        # without a target frame rate the processing quality is never degraded
+        self.quality = QualityController(target_fps, [model, zone_model, plate_model], self.canvas) \
+            if target_fps else None
+        self.last_detections = None
+
+        # clips around the occupancy changes are cut from the decoded frames, without overlays
+        if clip_dir:
+            self.clip_recorder = ClipRecorder(clip_dir, clip_pre, clip_post)
+
+        self.preview = None
+        if preview_port:
+            # the zones are read through the processor, as editing the zones file reloads them
+            self.preview = PreviewServer(preview_port, lambda: self.zones, preview_fps, preview_scale, preview_host)
 
         self.recorder = None
-        self.ffmpeg_process = None
+        self.ffmpeg_sink = None
         if self.output_format == MediaFormat.STREAM:
-            self.ffmpeg_process = self.open_ffmpeg_stream_process(self.output_path)
+            self.ffmpeg_sink = FfmpegSink(self.output_path, self.screen_width, self.screen_height,
+                                          stream_format, stream_scale)
 
         self.last_update = datetime.now()
         self.frame_count = 0
+        self.frame_id = 0
 
         if enable_canvas:
             self.stream_handlers = {
@@ -57,24 +85,20 @@ class StreamProcessor(InputProcessor):
         if auto_record:
             self.auto_record_start = datetime.now() + timedelta(seconds=auto_record)
 
-    def open_ffmpeg_stream_process(self, output_stream: str):
-        ''' Open FFMPEG output stream
+    def render(self):
+        ''' Render the processed stream frame onto the canvas
 
-        @param  output_stream    FFMPEG output stream
+        @param  None
 
-        @return A Popen object representing a running process '''
+        @return None '''
 
-        args = [
-            "ffmpeg", "-stream_loop", "-1", "-f", "rawvideo", "-pix_fmt", "rgb24", "-s",
-            f"{self.screen_width}x{self.screen_height}", "-i", "pipe:0", "-pix_fmt", "yuv420p",
-            "-rtsp_transport", "tcp", "-f", "rtsp", f"{output_stream}"
-        ]
-        return subprocess.Popen(args, stdin=subprocess.PIPE)
+        self.render_frame(self.cap.read() if self.freeze_frame != FreezeType.FROZEN else None)
 
-    def render(self):
-        ''' Render the processed stream frame onto the canvas
+    def render_frame(self, frame, detections=None):
+        ''' Process a frame read from the stream and render it onto the canvas
 
-        @param  None
+        @param  frame         The frame read from the stream, None if no new frame is available
+        @param  detections    Optional detections for the frame, when inference is done by the caller
 
         @return None '''
 
@@ -84,27 +108,64 @@ class StreamProcessor(InputProcessor):
             self.handle_k_r(None)
             self.auto_record_start = None
 
+        self.update_health()
+
+        # a headless canvas is only drawn while someone watches the preview or it is being recorded
+        if self.preview and self.canvas.headless:
+            self.canvas.set_enabled(bool(self.preview.clients or self.recorder or self.ffmpeg_sink))
+
         if self.freeze_frame != FreezeType.FROZEN:
-            self.__frame = self.cap.read()
+            self.__frame = frame
+            self.frame_id += 1
+            if self.clip_recorder and frame is not None:
+                self.clip_recorder.add_frame(frame)
 
             if self.freeze_frame == FreezeType.FREEZE_NEXT:
                 self.freeze_frame = FreezeType.FROZEN
 
         if self.__frame is not None:
-            self.canvas.draw_frame(self.__frame)
+            if self.quality and not self.quality.begin_frame() and detections is None:
+                detections = self.last_detections
+
+            self.canvas.draw_frame(self.__frame, key=self.frame_id)
 
-            self.draw_detections(self.__frame)
+            # a frozen frame keeps its id, so its detections are reused
+            self.last_detections = self.draw_detections(self.__frame, frame_key=self.frame_id, detections=detections)
 
             super().render()
             self.canvas.render()
 
-            if self.recorder:
-                self.recorder.capture_frame(self.canvas.screen)
+            # the annotated frame is exported once and handed to every output, which write it in the background
+            preview_frame = self.preview and self.preview.wants_frame()
+            if self.recorder or self.ffmpeg_sink or preview_frame:
+                annotated_frame = self.canvas.export_frame()
+                if self.recorder:
+                    self.recorder.write_frame(annotated_frame)
+                if self.ffmpeg_sink:
+                    self.ffmpeg_sink.submit(annotated_frame)
+                if preview_frame:
+                    self.preview.submit(annotated_frame)
+
+            if self.quality:
+                self.quality.end_frame()
+
+    def update_health(self):
+        ''' Mark the zones unavailable while the stream is down. Once frames arrive again, the zones
+        return to their detected state after the usual inertia
+
+        @param  None
+
+        @return None '''
+
+        if self.cap.health != StreamHealth.DOWN:
+            return
 
-            if self.ffmpeg_process:
-                self.__frame = cv2.rotate(self.pygame.surfarray.pixels3d(self.canvas.screen), cv2.ROTATE_90_CLOCKWISE)
-                self.__frame = cv2.flip(self.__frame, 1)
-                self.ffmpeg_process.stdin.write(self.__frame.tobytes())
+        for zone in self.zones:
+            if zone.status != PwZoneState.Unavailable:
+                zone.status = PwZoneState.Unavailable
+                zone.inertia = 0
+                zone.overlap = None
+                self.handle_occupancy_change(zone)
 
     def update_fps(self):
         ''' Calculate the FPS value for the stream
@@ -128,11 +189,22 @@ class StreamProcessor(InputProcessor):
         @return None '''
 
         self.cap.release()
+        print(f"Capture frames: {self.cap.stats()}")
+        print(f"Capture connection: {self.cap.connection_stats()}")
+        if self.quality:
+            print(f"Quality: {self.quality.stats()}")
         if self.recorder:
             self.recorder.end_recording()
-        if self.ffmpeg_process:
-            self.ffmpeg_process.stdin.close()
-            self.ffmpeg_process.wait()
+        if self.ffmpeg_sink:
+            self.ffmpeg_sink.close()
+            print(f"Stream output frames: {self.ffmpeg_sink.stats()}")
+        if self.preview:
+            self.preview.close()
+            print(f"Preview frames: {self.preview.stats()}")
+        if self.clip_recorder:
+            self.clip_recorder.close()
+            print(f"Clips: {self.clip_recorder.stats()}")
+        super().finalize()
 
     def handle_k_f(self, event):
         self.freeze_next_operation()
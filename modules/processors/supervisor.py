@@ -0,0 +1,357 @@
+from typing import List, Dict, Any
+from datetime import datetime
+import multiprocessing
+import queue
+import json
+import time
+
+from .ymodel import YoloProcessor
+from .zone import read_zones_from_file, ZONE_INERTIA_SECONDS
+from .mediaformat import parse_media_format
+from .vidbuff import ReconnectPolicy
+from .inference_service import InferenceService, INFERENCE_MAX_WAIT
+from ..protocol import SerialHandler, PwCommandCodes, PwZoneState, ZoneStatus
+
+
+WORKER_HEARTBEAT_SECONDS = 5.0
+WORKER_POLL_SECONDS = 0.5
+WORKER_STOP_TIMEOUT = 10.0
+
+DEFAULT_MODELS = {
+    "model": "yolov8n.pt",
+    "detect_zones": "zone.pt",
+    "license_plate": "licenseplate.pt",
+    "size": 640,
+    "percentage": 25,
+    "track": False,
+    "allow": None,
+}
+
+
+def read_site_config(filename) -> Dict[str, Any]:
+    ''' Read the site config file, a JSON object listing the streams of the site and the models used:
+
+        {"models": {"model": "yolov8n.pt", "allow": "2,7", ...},
+         "streams": [{"name": "north", "input": "rtsp://...", "zones": "north.cfg", "zone_offset": 0}, ...]}
+
+        @param filename  Path to the site config file
+
+        @return Dictionary with the "models" settings (defaults filled in) and the "streams" list '''
+
+    with open(filename, 'r') as file:
+        site = json.load(file)
+
+    if not site.get("streams"):
+        raise ValueError(f"No streams listed in {filename}")
+    for stream in site["streams"]:
+        if "input" not in stream or "zones" not in stream:
+            raise ValueError(f"Stream without input or zones in {filename}: {stream}")
+
+    site["models"] = {**DEFAULT_MODELS, **site.get("models", {})}
+    return site
+
+
+class ZoneEventNotifier():
+    """stands in for the SerialHandler of a stream worker, forwarding zone status to the supervisor """
+
+    def __init__(self, events, stream_index: int) -> None:
+        self.events = events
+        self.stream_index = stream_index
+        # the messages are queued, unlike the serial port they need no pacing
+        self.pace = 0
+
+    def send_command(self, tx_command: PwCommandCodes, tx_params: Any, index: int = 0) -> None:
+        if tx_command == PwCommandCodes.ZoneStatus:
+            self.send_zones(tx_params)
+
+    def send_zones(self, zones: List[ZoneStatus]):
+        ''' Forward the status of some zones to the supervisor
+
+        @param  zones    Zones whose status is sent, with their local zone ids
+
+        @return None '''
+
+        self.events.put((self.stream_index, [(zone.zoneId, zone.status.value, zone.count) for zone in zones]))
+
+
+def run_stream_worker(stream_index: int, stream: Dict[str, Any], models: Dict[str, Any], events, stop):
+    ''' Entry point of a stream worker process: process one stream headless, forwarding zone status changes
+    and a periodic snapshot of all its zones to the supervisor
+
+    @param  stream_index    Index of the stream in the site config
+    @param  stream          Settings of the stream from the site config
+    @param  models          Model settings from the site config
+    @param  events          Queue of zone status messages to the supervisor
+    @param  stop            Event set when the worker must stop
+
+    @return None '''
+
+    from .stream_processor import StreamProcessor
+
+    model_args = (models["size"], models["track"], models["percentage"], models["allow"])
+    model = YoloProcessor(models["model"], *model_args)
+    zone_model = YoloProcessor(models["detect_zones"], *model_args)
+    plate_model = YoloProcessor(models["license_plate"], *model_args)
+
+    notifier = ZoneEventNotifier(events, stream_index)
+    zones = read_zones_from_file(stream["zones"])
+    processor = StreamProcessor(stream["input"], parse_media_format(stream["input"]), model, zone_model, plate_model,
+                                zones, stream["zones"], False, None, "", notifier, None)
+
+    begin = time.monotonic()
+    last_snapshot = begin
+    try:
+        while not stop.is_set():
+            processor.render()
+
+            # zone states are only meaningful once the inertia window has passed since the start
+            now = time.monotonic()
+            if now - begin > ZONE_INERTIA_SECONDS and now - last_snapshot > WORKER_HEARTBEAT_SECONDS:
+                notifier.send_zones(processor.zones)
+                last_snapshot = now
+    finally:
+        processor.finalize()
+
+
+def run_shared_streams(streams: List[Dict[str, Any]], models: Dict[str, Any], events, stop):
+    ''' Process all the streams in this process, batching their frames through one shared instance of each
+    model. Batched inference does not track objects across frames
+
+    @param  streams    Settings of the streams from the site config
+    @param  models     Model settings from the site config
+    @param  events     Queue of zone status messages to the supervisor
+    @param  stop       Event set when processing must stop
+
+    @return None '''
+
+    from .stream_processor import StreamProcessor
+
+    # the models are shared by all the streams, whose frame ids overlap, so their results are not memoized
+    model_args = (models["size"], False, models["percentage"], models["allow"], False)
+    model = YoloProcessor(models["model"], *model_args)
+    zone_model = YoloProcessor(models["detect_zones"], *model_args)
+    plate_model = YoloProcessor(models["license_plate"], *model_args)
+    service = InferenceService(model, models.get("max_wait", INFERENCE_MAX_WAIT))
+
+    processors = []
+    notifiers = []
+    try:
+        for stream_index, stream in enumerate(streams):
+            notifier = ZoneEventNotifier(events, stream_index)
+            zones = read_zones_from_file(stream["zones"])
+            processor = StreamProcessor(stream["input"], parse_media_format(stream["input"]), model, zone_model,
+                                        plate_model, zones, stream["zones"], False, None, "", notifier, None)
+            service.add_stream(processor.cap, processor.render_frame)
+            processors.append(processor)
+            notifiers.append(notifier)
+
+        begin = time.monotonic()
+        last_snapshot = begin
+        while not stop.is_set():
+            service.run_once()
+
+            now = time.monotonic()
+            if now - begin > ZONE_INERTIA_SECONDS and now - last_snapshot > WORKER_HEARTBEAT_SECONDS:
+                for processor, notifier in zip(processors, notifiers):
+                    notifier.send_zones(processor.zones)
+                last_snapshot = now
+    finally:
+        for processor in processors:
+            processor.finalize()
+        print(f"Shared inference: {service.stats()}")
+
+
+class ZoneRegistry():
+    """zone status of the whole site, with zone ids made unique across the streams """
+
+    def __init__(self, streams: List[Dict[str, Any]]) -> None:
+        self.zones: List[ZoneStatus] = []
+        self.stream_zones: Dict[int, Dict[int, ZoneStatus]] = {}
+
+        offset = 0
+        for stream_index, stream in enumerate(streams):
+            offset = stream.get("zone_offset", offset)
+            self.stream_zones[stream_index] = {}
+            for zone in read_zones_from_file(stream["zones"]):
+                site_zone = ZoneStatus(zoneId=offset + zone.zoneId, status=PwZoneState.Unavailable, count=0,
+                                       points=zone.points)
+                self.zones.append(site_zone)
+                self.stream_zones[stream_index][zone.zoneId] = site_zone
+            offset = max([z.zoneId for z in self.zones], default=offset)
+
+        site_ids = [zone.zoneId for zone in self.zones]
+        if len(site_ids) != len(set(site_ids)):
+            raise ValueError("Zone ids are not unique across the site, check the zone_offset settings")
+
+        # zone status requests look zones up by id, all the zones are reported in id order
+        self.zones.sort(key=lambda z: z.zoneId)
+
+    def update(self, stream_index: int, zone_id: int, status: PwZoneState, count: int) -> ZoneStatus | None:
+        ''' Update the status of a zone of a stream
+
+        @param  stream_index    Index of the stream
+        @param  zone_id         Local zone id within the stream
+        @param  status          New status of the zone
+        @param  count           New count of the zone
+
+        @return The site zone if its status changed, otherwise None '''
+
+        site_zone = self.stream_zones[stream_index].get(zone_id)
+        if site_zone is None or (site_zone.status == status and site_zone.count == count):
+            return None
+
+        site_zone.status = status
+        site_zone.count = count
+        return site_zone
+
+    def set_unavailable(self, stream_index: int) -> List[ZoneStatus]:
+        ''' Mark all the zones of a stream as unavailable
+
+        @param  stream_index    Index of the stream
+
+        @return List of the site zones whose status changed '''
+
+        changed = []
+        for site_zone in self.stream_zones[stream_index].values():
+            if site_zone.status != PwZoneState.Unavailable:
+                site_zone.status = PwZoneState.Unavailable
+                changed.append(site_zone)
+        return changed
+
+
+class Supervisor():
+    """runs one worker process per stream of a site and serves the zone status of the whole site """
+
+    def __init__(self, site: Dict[str, Any], serial_handler: SerialHandler | None, shared_model=False) -> None:
+        self.streams = site["streams"]
+        self.shared_model = shared_model
+        self.models = site["models"]
+        self.registry = ZoneRegistry(self.streams)
+        self.serial_handler = serial_handler
+
+        self.ctx = multiprocessing.get_context("spawn")
+        self.events = self.ctx.Queue()
+        self.stop = self.ctx.Event()
+        self.workers: Dict[int, multiprocessing.Process] = {}
+        self.restart_policies = {index: ReconnectPolicy() for index in range(len(self.streams))}
+        self.restart_at: Dict[int, float] = {}
+        self.restarts = {index: 0 for index in range(len(self.streams))}
+
+    def start_shared_worker(self):
+        ''' Start a single worker process running all the streams with shared, batched models
+
+        @param  None
+
+        @return None '''
+
+        print(f"Starting shared worker for {len(self.streams)} streams")
+        worker = self.ctx.Process(target=run_shared_streams, daemon=True,
+                                  args=(self.streams, self.models, self.events, self.stop))
+        worker.start()
+        for stream_index in range(len(self.streams)):
+            self.workers[stream_index] = worker
+
+    def start_worker(self, stream_index: int):
+        ''' Start the worker process of a stream
+
+        @param  stream_index    Index of the stream
+
+        @return None '''
+
+        stream = self.streams[stream_index]
+        print(f"Starting worker for stream {stream.get('name', stream_index)}: {stream['input']}")
+        worker = self.ctx.Process(target=run_stream_worker, daemon=True,
+                                  args=(stream_index, stream, self.models, self.events, self.stop))
+        worker.start()
+        self.workers[stream_index] = worker
+
+    def handle_zone_change(self, zone: ZoneStatus):
+        ''' Send out a change of the site zone status
+
+        @param  zone    Site zone that changed
+
+        @return None '''
+
+        if self.serial_handler:
+            self.serial_handler.send_command(PwCommandCodes.ZoneStatus, [zone])
+        else:
+            print(f"{datetime.now()} Zone {zone.zoneId}: {zone.status.name}")
+
+    def check_workers(self):
+        ''' Restart the workers that exited, with a growing delay for workers that keep failing. The zones
+        of a stream are unavailable until its worker reports them again
+
+        @param  None
+
+        @return None '''
+
+        now = time.monotonic()
+        # in shared model mode all the streams run in the same worker, keyed by the first stream
+        worker_streams: Dict[multiprocessing.Process, List[int]] = {}
+        for stream_index, worker in self.workers.items():
+            worker_streams.setdefault(worker, []).append(stream_index)
+
+        for worker, stream_indexes in worker_streams.items():
+            key = stream_indexes[0]
+            if worker.is_alive() or self.stop.is_set():
+                continue
+
+            if key not in self.restart_at:
+                print(f"Worker for streams {stream_indexes} exited with code {worker.exitcode}")
+                for stream_index in stream_indexes:
+                    for zone in self.registry.set_unavailable(stream_index):
+                        self.handle_zone_change(zone)
+                self.restart_at[key] = now + self.restart_policies[key].next_delay()
+            elif now >= self.restart_at[key]:
+                del self.restart_at[key]
+                self.restarts[key] += 1
+                if self.shared_model:
+                    self.start_shared_worker()
+                else:
+                    self.start_worker(key)
+
+    def run(self):
+        ''' Run the workers of all streams and aggregate their zone status until interrupted
+
+        @param  None
+
+        @return None '''
+
+        if self.shared_model:
+            self.start_shared_worker()
+        else:
+            for stream_index in range(len(self.streams)):
+                self.start_worker(stream_index)
+
+        try:
+            while True:
+                try:
+                    stream_index, zones = self.events.get(timeout=WORKER_POLL_SECONDS)
+                except queue.Empty:
+                    self.check_workers()
+                    continue
+
+                # a worker reporting its zones is healthy again
+                self.restart_policies[stream_index].reset()
+                for zone_id, status, count in zones:
+                    site_zone = self.registry.update(stream_index, zone_id, PwZoneState(status), count)
+                    if site_zone:
+                        self.handle_zone_change(site_zone)
+                self.check_workers()
+
+        finally:
+            self.finalize()
+
+    def finalize(self):
+        ''' Stop all the workers
+
+        @param  None
+
+        @return None '''
+
+        self.stop.set()
+        for worker in set(self.workers.values()):
+            worker.join(WORKER_STOP_TIMEOUT)
+            if worker.is_alive():
+                worker.terminate()
+        print(f"Worker restarts: {self.restarts}")
@@ -0,0 +1,138 @@
+from typing import List, Dict
+import csv
+import json
+
+from ..protocol import PwZoneState
+
+
+class OccupancyInterval():
+    def __init__(self, zone_id: int, state: PwZoneState, start_frame: int, fps: float) -> None:
+        self.zone_id = zone_id
+        self.state = state
+        self.start_frame = start_frame
+        self.end_frame = None
+        self.fps = fps
+
+    def to_dict(self) -> Dict:
+        ''' Get the interval as a dictionary. Times are in seconds from the start of the video, and
+        the end frame is the first frame no longer in this state
+
+        @param None
+
+        @return Dictionary describing the interval '''
+
+        return {
+            "zone": self.zone_id,
+            "state": self.state.name,
+            "start_frame": self.start_frame,
+            "end_frame": self.end_frame,
+            "start_time": round(self.start_frame / self.fps, 3) if self.fps else None,
+            "end_time": round(self.end_frame / self.fps, 3) if self.fps and self.end_frame is not None else None,
+        }
+
+
+class OccupancyTimeline():
+    """records the intervals during which each zone stayed in the same state """
+
+    FIELDS = ["zone", "state", "start_frame", "end_frame", "start_time", "end_time"]
+
+    def __init__(self, fps: float) -> None:
+        self.fps = fps
+        self.intervals: List[OccupancyInterval] = []
+        self.current: Dict[int, OccupancyInterval] = {}
+
+    def update(self, zone_id: int, state: PwZoneState, frame_index: int):
+        ''' Record the state of a zone at a frame, starting a new interval if the state changed
+
+        @param zone_id        Id of the zone
+        @param state          State of the zone at this frame
+        @param frame_index    Index of the frame in the video
+
+        @return None '''
+
+        interval = self.current.get(zone_id)
+        if interval and interval.state == state:
+            return
+
+        if interval:
+            interval.end_frame = frame_index
+        interval = OccupancyInterval(zone_id, state, frame_index, self.fps)
+        self.intervals.append(interval)
+        self.current[zone_id] = interval
+
+    def close(self, frame_index: int):
+        ''' End all the ongoing intervals
+
+        @param frame_index    Index of the first frame after the processed range
+
+        @return None '''
+
+        for interval in self.current.values():
+            interval.end_frame = frame_index
+        self.current = {}
+
+    def clip(self, start_frame: int) -> "OccupancyTimeline":
+        ''' Get the part of the timeline from a frame on, the intervals ongoing at that frame start there
+
+        @param start_frame    Index of the first frame kept
+
+        @return The clipped timeline '''
+
+        clipped = OccupancyTimeline(self.fps)
+        for interval in self.intervals:
+            if interval.end_frame is not None and interval.end_frame <= start_frame:
+                continue
+            kept = OccupancyInterval(interval.zone_id, interval.state, max(interval.start_frame, start_frame), self.fps)
+            kept.end_frame = interval.end_frame
+            clipped.intervals.append(kept)
+        return clipped
+
+    @classmethod
+    def stitch(cls, timelines: List["OccupancyTimeline"]) -> "OccupancyTimeline":
+        ''' Join the timelines of consecutive segments of a video. An interval ending exactly where the
+        next interval of the same zone and state starts is merged with it
+
+        @param timelines    Timelines of the segments, covering adjacent frame ranges
+
+        @return The timeline of the whole range '''
+
+        stitched = cls(timelines[0].fps if timelines else 0.0)
+        intervals = sorted([i for timeline in timelines for i in timeline.intervals],
+                           key=lambda i: (i.zone_id, i.start_frame))
+        previous = None
+        for interval in intervals:
+            if previous and previous.zone_id == interval.zone_id and previous.state == interval.state and \
+               previous.end_frame == interval.start_frame:
+                previous.end_frame = interval.end_frame
+                continue
+            stitched.intervals.append(interval)
+            previous = interval
+
+        return stitched
+
+    def get_intervals(self) -> List[Dict]:
+        ''' Get the recorded intervals sorted by zone and start frame
+
+        @param None
+
+        @return List of interval dictionaries '''
+
+        intervals = sorted(self.intervals, key=lambda i: (i.zone_id, i.start_frame))
+        return [interval.to_dict() for interval in intervals]
+
+    def write(self, output_path: str):
+        ''' Write the timeline as CSV (for a .csv path) or JSON lines (any other path)
+
+        @param output_path    Path of the timeline file
+
+        @return None '''
+
+        intervals = self.get_intervals()
+        with open(output_path, "w", newline="") as file:
+            if output_path.lower().endswith(".csv"):
+                writer = csv.DictWriter(file, fieldnames=self.FIELDS)
+                writer.writeheader()
+                writer.writerows(intervals)
+            else:
+                for interval in intervals:
+                    file.write(json.dumps(interval) + "\n")
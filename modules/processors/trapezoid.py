@@ -1,6 +1,7 @@
 from scipy.spatial import ConvexHull
 from math import atan, sin, cos, sqrt
 from typing import List
+import heapq
 
 
 def non_zero(x):
@@ -41,8 +42,35 @@ def find_best_fit_trapezoid(points):
     # Calculate convex hull
     hull = ConvexHull(points)
     hull_vertices = [points[vertex] for vertex in hull.vertices]
+    count = len(hull_vertices)
+    if count <= 4:
+        return hull_vertices
 
-    while len(hull_vertices) > 4:
-        remove_least_deviation(hull_vertices)
+    # The vertices form a ring, the vertex of least deviation is removed until 4 remain. Only the deviations
+    # of the two neighbours change when a vertex is removed, the heap keeps the others in order. Deviations
+    # are computed with find_deviation() only, so ties are resolved exactly as by remove_least_deviation()
+    prev = [(index - 1) % count for index in range(count)]
+    next = [(index + 1) % count for index in range(count)]
+    current = [find_deviation(hull_vertices[prev[index]], hull_vertices[index], hull_vertices[next[index]])
+               for index in range(count)]
+    # ties go to the first vertex in hull order, as when scanning the remaining vertices
+    heap = [(deviation, index) for index, deviation in enumerate(current)]
+    heapq.heapify(heap)
+    removed = [False] * count
 
-    return hull_vertices
+    while count > 4:
+        deviation, index = heapq.heappop(heap)
+        if removed[index] or deviation != current[index]:
+            continue   # entry of a removed vertex, or outdated by the removal of a neighbour
+
+        removed[index] = True
+        count -= 1
+        before, after = prev[index], next[index]
+        next[before], prev[after] = after, before
+
+        for neighbour in (before, after):
+            current[neighbour] = find_deviation(hull_vertices[prev[neighbour]], hull_vertices[neighbour],
+                                                hull_vertices[next[neighbour]])
+            heapq.heappush(heap, (current[neighbour], neighbour))
+
+    return [vertex for vertex, gone in zip(hull_vertices, removed) if not gone]
@@ -1,14 +1,67 @@
+from enum import Enum
+from typing import List
 import cv2
+import numpy as np
 import queue
+import random
 import threading
 import time
 
+from ..scheduling import pin_current_thread
+
+
+# Number of frame buffers decoded into: one held by the consumer, one published, one being decoded
+FRAME_POOL_SIZE = 3
+
+RECONNECT_INITIAL_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+RECONNECT_JITTER = 0.25
+RECONNECT_ATTEMPTS_BEFORE_DOWN = 3
+
+
+class StreamHealth(Enum):
+    CONNECTED = 0
+    RECONNECTING = 1
+    DOWN = 2
+
+
+class ReconnectPolicy():
+    """exponential backoff with jitter between reconnection attempts """
+
+    def __init__(self, initial_delay=RECONNECT_INITIAL_DELAY, max_delay=RECONNECT_MAX_DELAY,
+                 jitter=RECONNECT_JITTER) -> None:
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        ''' Get the delay before the next reconnection attempt
+
+        @param None
+
+        @return Delay in seconds, doubling with each attempt up to the maximum, randomized by the jitter '''
+
+        delay = min(self.initial_delay * (2 ** self.attempts), self.max_delay)
+        self.attempts += 1
+        return delay * random.uniform(1.0 - self.jitter, 1.0 + self.jitter)
+
+    def reset(self):
+        ''' Restart the backoff once frames are read again after an outage
+
+        @param None
+
+        @return None '''
+
+        self.attempts = 0
+
 
 class BufferlessVideoCapture:
     """reads frames in background and only provides a get to the latest frame """
 
     def __init__(self, input_path, is_video: bool):
         self.input_path = input_path
+        self.is_video = is_video
 
         self.cap = cv2.VideoCapture(input_path)
         if not self.cap.isOpened():
@@ -19,7 +72,24 @@ class BufferlessVideoCapture:
             self.frame_delay = 1.0 / self.cap.get(cv2.CAP_PROP_FPS)
 
         print(f"frame_delay: {self.frame_delay}")
-        self.q = queue.Queue()
+        self.buffers = []
+        self.condition = threading.Condition()
+        self.latest = None
+        self.sequence = 0
+        self.consumed_sequence = 0
+        self.consumed = None
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.listeners: List[threading.Event] = []
+
+        self.health = StreamHealth.CONNECTED
+        self.reconnect_policy = ReconnectPolicy()
+        self.reconnects = 0
+        self.outages = []
+        # start of the ongoing outage, which only ends with a frame read, not when the stream opens
+        self.outage_begin = None
+        self.stop_event = threading.Event()
+
         self.running = True
         self.thread = threading.Thread(target=self._reader)
         self.thread.start()
@@ -41,37 +111,209 @@ class BufferlessVideoCapture:
         @return The cv2 result of releasing the video or stream '''
 
         self.running = False
+        self.stop_event.set()
         self.thread.join()
         return self.cap.release()
 
     def read(self, timeout=0.05):
-        ''' Retrieve the latest buffered frame
+        ''' Retrieve the latest decoded frame, waiting for one newer than the previously read frame.
+        The frame buffer is reused once read() is called again, so it must be copied to be kept longer
+
+        @param timeout    If no newer frame is available after the timeout period, return None
 
-        @param timeout    If no frame is available after the timeout period, return None
+        @return The latest decoded frame, or None if no newer frame is available '''
 
-        @return The latest buffered frame, or None if no frames are available '''
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.sequence > self.consumed_sequence, timeout):
+                return None
 
-        try:
-            return self.q.get(block=True, timeout=timeout)
-        except queue.Empty:
-            return None
+            self.consumed = self.latest
+            self.consumed_sequence = self.sequence
+            return self.buffers[self.consumed]
+
+    def stats(self):
+        ''' Get the number of frames decoded and the number of frames replaced before being read
+
+        @param None
+
+        @return Dictionary with the read and dropped frame counts '''
+
+        with self.condition:
+            return {"read": self.frames_read, "dropped": self.frames_dropped, "sequence": self.sequence}
+
+    def connection_stats(self):
+        ''' Get the connection health along with the reconnection count and outage durations
+
+        @param None
+
+        @return Dictionary with the health, reconnects, outages, and total and longest outage in seconds '''
+
+        return {"health": self.health.name, "reconnects": self.reconnects, "outages": len(self.outages),
+                "outage_total": round(sum(self.outages), 3), "outage_max": round(max(self.outages, default=0.0), 3)}
+
+    def _next_buffer(self):
+        # any buffer neither published nor held by the consumer can be decoded into
+        with self.condition:
+            for index in range(len(self.buffers)):
+                if index != self.latest and index != self.consumed:
+                    return index
+        return None
+
+    def _publish(self, index):
+        with self.condition:
+            if self.sequence > self.consumed_sequence:
+                self.frames_dropped += 1   # previous (unprocessed) frame is discarded
+            self.latest = index
+            self.sequence += 1
+            self.frames_read += 1
+            self.condition.notify_all()
+        for listener in self.listeners:
+            listener.set()
 
     def _reader(self):
+        pin_current_thread("decode")
         while self.running:
-            ret, frame = self.cap.read()
+            index = self._next_buffer()
+            buffer = self.buffers[index] if index is not None else None
+            ret, frame = self.cap.read(image=buffer)
             if not ret:
                 print(f"Error: failed to read {self.input_path}")
-                self.cap = cv2.VideoCapture(self.input_path)
-                if not self.cap.isOpened():
-                    print("Error: Unable to open RTSP stream")
-                    break
-
-            if not self.q.empty():
-                try:
-                    self.q.get_nowait()   # discard previous (unprocessed) frame
-                except queue.Empty:
-                    pass
-            self.q.put(frame)
+                # a video file simply loops back to its start
+                if not self.is_video or not self._open():
+                    self._reconnect()
+                continue
+
+            if frame is not buffer:
+                # first frame, or the frame geometry changed: (re)allocate the pool to match
+                with self.condition:
+                    self.buffers = [frame] + [np.empty_like(frame) for _ in range(FRAME_POOL_SIZE - 1)]
+                    self.latest = None
+                    self.consumed = None
+                index = 0
+
+            self._publish(index)
+            if self.outage_begin is not None:
+                self._reconnected()
 
             if self.frame_delay:
                 time.sleep(self.frame_delay)
+
+    def _open(self) -> bool:
+        self.cap.release()
+        self.cap = cv2.VideoCapture(self.input_path)
+        return self.cap.isOpened()
+
+    def _reconnect(self):
+        # retry with backoff until the stream opens again (or the capture is released). The backoff goes on
+        # until a frame is read, a stream that opens but fails every read still ends up DOWN
+        if self.outage_begin is None:
+            self.outage_begin = time.monotonic()
+            self.health = StreamHealth.RECONNECTING
+        while self.running:
+            if self.reconnect_policy.attempts >= RECONNECT_ATTEMPTS_BEFORE_DOWN:
+                self.health = StreamHealth.DOWN
+
+            delay = self.reconnect_policy.next_delay()
+            print(f"Reconnecting to {self.input_path} in {delay:.1f}s ({self.health.name})")
+            if self.stop_event.wait(delay):
+                break
+
+            if self._open():
+                return
+
+    def _reconnected(self):
+        # the first frame after an outage ends it
+        outage = time.monotonic() - self.outage_begin
+        self.outages.append(outage)
+        self.reconnects += 1
+        self.reconnect_policy.reset()
+        self.health = StreamHealth.CONNECTED
+        self.outage_begin = None
+        print(f"Reconnected to {self.input_path} after {outage:.1f}s")
+
+
+PREFETCH_FRAMES = 64
+# Sampling steps from which seeking (decoding from the previous keyframe) beats grabbing every frame
+SEEK_STEP_FRAMES = 120
+
+
+class PrefetchVideoCapture:
+    """decodes every frame (or every step-th frame) of a video file in background, without dropping or
+    pacing frames """
+
+    def __init__(self, input_path, prefetch=PREFETCH_FRAMES, start_frame=0, end_frame=None, step=1):
+        self.input_path = input_path
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.step = step
+
+        self.cap = cv2.VideoCapture(input_path)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Unable to open {self.input_path}")
+        if start_frame:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+        self.q = queue.Queue(maxsize=prefetch)
+        self.running = True
+        self.thread = threading.Thread(target=self._reader)
+        self.thread.start()
+
+    def get(self, param):
+        ''' Get properties of the video being processed
+
+        @param param    The property being requested
+
+        @return The property being requested '''
+
+        return self.cap.get(param)
+
+    def release(self):
+        ''' Stop decoding and release the cv2 video being processed
+
+        @param None
+
+        @return The cv2 result of releasing the video '''
+
+        self.running = False
+        # unblock the reader if it is waiting for room in the queue
+        while self.thread.is_alive():
+            try:
+                self.q.get(timeout=0.05)
+            except queue.Empty:
+                pass
+        self.thread.join()
+        return self.cap.release()
+
+    def read(self):
+        ''' Retrieve the next decoded frame, waiting for it if needed
+
+        @param None
+
+        @return An (index, frame) tuple, or None once the end of the video is reached '''
+
+        return self.q.get()
+
+    def _reader(self):
+        pin_current_thread("decode")
+        index = self.start_frame
+        while self.running and (self.end_frame is None or index < self.end_frame):
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+
+            self.q.put((index, frame))
+            index += self.step
+
+            if self.step >= SEEK_STEP_FRAMES:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            elif not self._skip(self.step - 1):
+                break
+
+        self.q.put(None)
+
+    def _skip(self, count) -> bool:
+        # grab() advances without converting the frame, only sampled frames are retrieved
+        for _ in range(count):
+            if not self.cap.grab():
+                return False
+        return True
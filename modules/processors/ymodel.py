@@ -62,12 +62,15 @@ class YoloDetection():
 
 
 class YoloProcessor():
-    def __init__(self, model_name, imgsz, track, percentage, allow) -> None:
+    def __init__(self, model_name, imgsz, track, percentage, allow, memoize=True) -> None:
         self.imgsz = imgsz
         self.model = YOLO(model_name)
         self.track = track
         self.percentage = percentage
         self.allow = [int(a) for a in allow.split(',')] if allow is not None else []
+        # Turned off for models shared by several streams, whose keys may collide
+        self.memoize = memoize
+        self.__memo = {}
         print(f"{self.allow}")
 
     def __validate_percentage(self):
@@ -85,13 +88,31 @@ class YoloProcessor():
         self.percentage = update
         self.__validate_percentage()
 
-    def predict(self, source) -> List[YoloDetection]:
+    def __memoize(self, name, key, run):
+        # Results are reused while both the input identity and the detection settings are unchanged
+        if key is None or not self.memoize:
+            return run()
+
+        memo_key = (key, self.imgsz, self.track, self.percentage, tuple(self.allow))
+        memo = self.__memo.get(name)
+        if memo is None or memo[0] != memo_key:
+            memo = (memo_key, run())
+            self.__memo[name] = memo
+        return memo[1]
+
+    def predict(self, source, key=None) -> List[YoloDetection]:
         ''' Perform object detection and/or tracking on the source media
 
         @param source    The source image path or video/stream frame
+        @param key       Optional identity of the source (e.g. path and mtime, or frame id). When given, the
+                         detections of the previous call are returned again if the key and the detection
+                         settings are unchanged, unless memoization is turned off
 
         @return List of detected objects '''
 
+        return self.__memoize("predict", key, lambda: self.__predict(source))
+
+    def __predict(self, source) -> List[YoloDetection]:
         if self.track:
             results = self.model.track(source, verbose=False, imgsz=self.imgsz, persist=True,
                                        conf=self.percentage / 100.0)
@@ -99,14 +120,46 @@ class YoloProcessor():
             results = self.model.predict(source, verbose=False, imgsz=self.imgsz, conf=self.percentage / 100.0)
         detections = []
         for result in results:
-            for i, cls in enumerate(result.boxes.cls):
-                type = int(cls)
-                if type not in self.allow:
-                    continue
-                id = int(result.boxes.id[i]) if result.boxes.id is not None else 0
-                name = result.names[type]
-                score = result.boxes.conf[i]
-                box = result.boxes.xyxy[i]
-                mask = result.masks.xy[i] if result.masks else None
-                detections.append(YoloDetection(type, id, name, score, box, mask, self.track))
+            detections += self.__get_detections(result)
+        return detections
+
+    def predict_batch(self, sources, offsets=None, key=None) -> List[List[YoloDetection]]:
+        ''' Perform object detection on several images in a single batched model call
+
+        @param sources    List of images (e.g. crops of a frame) to be processed together
+        @param offsets    Optional list of (x, y) offsets added to the detections of each image, so that
+                          detections on a crop are reported in the coordinates of the original frame
+        @param key        Optional identity of the sources, see predict()
+
+        @return List holding the list of detected objects for each source '''
+
+        return self.__memoize("predict_batch", key, lambda: self.__predict_batch(sources, offsets))
+
+    def __predict_batch(self, sources, offsets) -> List[List[YoloDetection]]:
+        if not sources:
+            return []
+
+        if offsets is None:
+            offsets = [(0, 0)] * len(sources)
+
+        # Tracking is meaningless across unrelated images, so batches always use plain prediction
+        results = self.model.predict(sources, verbose=False, imgsz=self.imgsz, conf=self.percentage / 100.0)
+        return [self.__get_detections(result, offset) for result, offset in zip(results, offsets)]
+
+    def __get_detections(self, result, offset=(0, 0)) -> List[YoloDetection]:
+        detections = []
+        for i, cls in enumerate(result.boxes.cls):
+            type = int(cls)
+            if type not in self.allow:
+                continue
+            id = int(result.boxes.id[i]) if result.boxes.id is not None else 0
+            name = result.names[type]
+            score = result.boxes.conf[i]
+            box = result.boxes.xyxy[i]
+            mask = result.masks.xy[i] if result.masks else None
+            if offset != (0, 0):
+                box = [float(box[0]) + offset[0], float(box[1]) + offset[1],
+                       float(box[2]) + offset[0], float(box[3]) + offset[1]]
+                mask = mask + offset if mask is not None else None
+            detections.append(YoloDetection(type, id, name, score, box, mask, self.track))
         return detections
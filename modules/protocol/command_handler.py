@@ -16,27 +16,26 @@ class CommandHandler():
             logging.error(f"unknown command code: {command}")
             return (PwCommandCodes.Nak, None)
 
+    def __find_zones(self, zoneId: Any) -> List[ZoneStatus] | None:
+        # zones are looked up by id, the ids of a site may have gaps and the list may not be sorted
+        if zoneId == 0:
+            return self.zones
+        zone = next((zone for zone in self.zones if zone.zoneId == zoneId), None)
+        return [zone] if zone is not None else None
+
     def __handle_Ping(self, params: Any) -> Tuple[PwCommandCodes, Any]:
         return (PwCommandCodes.Pong, None)
 
     def __handle_RequestZoneStatus(self, zoneId: Any) -> Tuple[PwCommandCodes, Any]:
-        parameters = None
-        if zoneId == 0:
-            parameters = self.zones
-        elif 0 < zoneId <= len(self.zones):
-            parameters = [self.zones[zoneId - 1]]
-        else:
+        parameters = self.__find_zones(zoneId)
+        if parameters is None:
             return (PwCommandCodes.NAK, None)
 
         return (PwCommandCodes.ZoneStatus, parameters)
 
     def __handle_RequestZoneConfig(self, zoneId: Any) -> Tuple[PwCommandCodes, Any]:
-        parameters = None
-        if zoneId == 0:
-            parameters = self.zones
-        elif 0 < zoneId <= len(self.zones):
-            parameters = [self.zones[zoneId - 1]]
-        else:
+        parameters = self.__find_zones(zoneId)
+        if parameters is None:
             return (PwCommandCodes.NAK, None)
 
         return (PwCommandCodes.ZoneConfig, parameters)
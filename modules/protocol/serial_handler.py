@@ -1,11 +1,17 @@
 
 import serial
+import time
 from threading import Thread, RLock
 from typing import List, Any
 from .park_detect_types import *
 from .bytebeam import ByteBeamProtocol, ByteBeamHeader, SequenceType
 from .command_handler import CommandHandler
 from .command_processor import CommandProcessor
+from ..scheduling import pin_current_thread
+
+
+# Delay after each command sent, paces the transmissions on the serial port
+SERIAL_PACE_SECONDS = 0.1
 
 
 class SerialHandler():
@@ -13,6 +19,7 @@ class SerialHandler():
         self.__serial_port = serial.Serial ("/dev/ttyAMA0", 19200, parity="E")    # Open port with baud rate
         self.__codec = ByteBeamProtocol()
         self.__command_handler = CommandHandler(zones=zones, config=config)
+        self.pace = SERIAL_PACE_SECONDS
 
     def start_rx_thread(self):
         self.__mutex = RLock()
@@ -36,8 +43,13 @@ class SerialHandler():
             tx_data = self.__encode_command(tx_command=tx_command, tx_params=tx_params, index=index)
             if tx_data:
                 self.__serial_port.write(tx_data)
+        # HACK: transmission should be handled on a seperate thread of execution to avoid
+        # this delay leaking out
+        if tx_data and self.pace:
+            time.sleep(self.pace)
 
     def __handle_serial_port(self):
+        pin_current_thread("serial")
         while self.__is_running:
             with self.__mutex:
                 rx_data = self.__serial_port.read_all()
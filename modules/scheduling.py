@@ -0,0 +1,191 @@
+from typing import Dict, Set, List
+import json
+import os
+import time
+
+
+STAGES = ["decode", "inference", "render", "serial"]
+THREAD_SETTINGS = ["torch", "opencv", "blas"]
+BLAS_THREAD_VARIABLES = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS"]
+SELF_TEST_ITERATIONS = 20
+
+
+def parse_cores(value) -> Set[int]:
+    ''' Parse a set of cores such as "2-5" or "0+2+4-5", or a list of cores and core ranges from a JSON file
+    such as [2, 3] or ["0-1", 4]
+
+    @param  value    Core ranges joined by "+", a core index or a list of either
+
+    @return Set of core indexes '''
+
+    if isinstance(value, list):
+        return set().union(*[parse_cores(item) for item in value])
+
+    cores = set()
+    for part in str(value).split("+"):
+        first, _, last = part.partition("-")
+        cores.update(range(int(first), int(last or first) + 1))
+    return cores
+
+
+class SchedulingPlan():
+    """thread counts of the libraries and core sets of the pipeline stages """
+
+    def __init__(self, threads: Dict[str, int] = None, cores: Dict[str, Set[int]] = None) -> None:
+        self.threads = threads or {}
+        self.cores = cores or {}
+
+        for name in self.threads:
+            if name not in THREAD_SETTINGS:
+                raise ValueError(f"Unknown thread setting: {name}")
+        for stage in self.cores:
+            if stage not in STAGES:
+                raise ValueError(f"Unknown stage: {stage}")
+
+    @classmethod
+    def parse(cls, spec: str) -> "SchedulingPlan":
+        ''' Create a plan from a spec such as "torch=4,opencv=1,blas=1,decode=0-1,inference=2-5,render=6,serial=7",
+        or from the path of a JSON file holding the same keys
+
+        @param  spec    The scheduling spec or JSON file path
+
+        @return The scheduling plan, a ValueError is raised for an invalid spec '''
+
+        if os.path.isfile(spec):
+            with open(spec, 'r') as file:
+                items = json.load(file)
+            if not isinstance(items, dict):
+                raise ValueError(f"{spec} must hold a JSON object")
+        else:
+            items = {}
+            for item in spec.split(","):
+                key, separator, value = item.partition("=")
+                if item and not separator:
+                    raise ValueError(f"Invalid scheduling item, expected key=value: {item}")
+                if item:
+                    items[key] = value
+
+        try:
+            threads = {key: int(value) for key, value in items.items() if key in THREAD_SETTINGS}
+            cores = {key: parse_cores(value) for key, value in items.items() if key not in THREAD_SETTINGS}
+        except TypeError as e:
+            raise ValueError(f"Invalid scheduling value: {e}")
+        return cls(threads, cores)
+
+    def apply(self, settings: List[str] = THREAD_SETTINGS):
+        ''' Apply the thread counts to torch, OpenCV and the BLAS libraries. BLAS environment variables only
+        affect libraries loaded afterwards (and child processes), so threadpoolctl is used when available
+
+        @param  settings    Thread settings applied, i.e. only "opencv" in a process that decodes without
+                            running inference, so torch is not imported there
+
+        @return None '''
+
+        if "blas" in self.threads and "blas" in settings:
+            for variable in BLAS_THREAD_VARIABLES:
+                os.environ[variable] = str(self.threads["blas"])
+            try:
+                from threadpoolctl import threadpool_limits
+                threadpool_limits(limits=self.threads["blas"], user_api="blas")
+            except ImportError:
+                pass
+
+        if "torch" in self.threads and "torch" in settings:
+            import torch
+            torch.set_num_threads(self.threads["torch"])
+
+        if "opencv" in self.threads and "opencv" in settings:
+            import cv2
+            cv2.setNumThreads(self.threads["opencv"])
+
+    def pin(self, *stages: str):
+        ''' Pin the calling thread to the cores of some stages. Threads created afterwards by the calling thread
+        (i.e. torch workers) inherit its affinity
+
+        @param  stages    Stages whose cores the thread may run on
+
+        @return None '''
+
+        cores = set().union(*[self.cores.get(stage, set()) for stage in stages])
+        if cores and hasattr(os, "sched_setaffinity"):
+            # on Linux, pid 0 applies to the calling thread only
+            os.sched_setaffinity(0, cores)
+
+    def __repr__(self) -> str:
+        cores = {stage: sorted(cores) for stage, cores in self.cores.items()}
+        return f"threads:{self.threads}, cores:{cores}"
+
+
+plan: SchedulingPlan | None = None
+
+
+def set_plan(new_plan: SchedulingPlan | None, settings: List[str] = THREAD_SETTINGS):
+    ''' Set and apply the scheduling plan of the process
+
+    @param  new_plan    The scheduling plan, None to keep the library defaults
+    @param  settings    Thread settings applied in this process, see SchedulingPlan.apply()
+
+    @return None '''
+
+    global plan
+    plan = new_plan
+    if plan:
+        plan.apply(settings)
+
+
+def get_plan() -> SchedulingPlan | None:
+    return plan
+
+
+def pin_current_thread(*stages: str):
+    ''' Pin the calling thread to the cores of some stages, if a scheduling plan is set
+
+    @param  stages    Stages run by the calling thread
+
+    @return None '''
+
+    if plan:
+        plan.pin(*stages)
+
+
+def get_candidate_plans() -> List[SchedulingPlan]:
+    ''' Get the plans compared by the self-test: powers of two of torch threads up to the number of cores,
+    with OpenCV and BLAS limited to a single thread or using all the cores. Stage core sets are not compared,
+    the self-test only runs inference, without the decode and render stages competing for the cores
+
+    @param  None
+
+    @return List of scheduling plans '''
+
+    cpu_count = os.cpu_count() or 1
+    torch_threads = sorted({min(2 ** i, cpu_count) for i in range(cpu_count.bit_length() + 1)})
+    plans = []
+    for threads in torch_threads:
+        plans.append(SchedulingPlan({"torch": threads, "opencv": cpu_count, "blas": cpu_count}))
+        plans.append(SchedulingPlan({"torch": threads, "opencv": 1, "blas": 1}))
+    return plans
+
+
+def run_self_test(model, frame, plans: List[SchedulingPlan] = None, iterations=SELF_TEST_ITERATIONS):
+    ''' Measure the inference frames per second of each plan on the current machine. Only the thread counts
+    of the plans are applied
+
+    @param  model         The YoloProcessor used for the measurement
+    @param  frame         A frame representative of the input
+    @param  plans         Plans to compare, by default those of get_candidate_plans()
+    @param  iterations    Number of predictions timed for each plan
+
+    @return List of (plan, fps) tuples sorted from fastest to slowest '''
+
+    results = []
+    for candidate in plans or get_candidate_plans():
+        candidate.apply()
+        model.predict(frame)   # warm up
+        begin = time.perf_counter()
+        for _ in range(iterations):
+            model.predict(frame)
+        fps = iterations / (time.perf_counter() - begin)
+        print(f"{candidate}: {fps:.2f} frames/s")
+        results.append((candidate, fps))
+
+    return sorted(results, key=lambda result: result[1], reverse=True)